@@ -4,15 +4,21 @@ Receives voice messages and uploads them to Google Drive for processing.
 """
 
 import os
-import io
+import json
+import asyncio
 import logging
-from datetime import datetime
+import tempfile
+import threading
+import time
+import httplib2
 from pathlib import Path
 
 from telegram import Update
+from telegram.request import HTTPXRequest
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 from dotenv import load_dotenv
@@ -29,63 +35,252 @@ logger = logging.getLogger(__name__)
 # Configuration
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 GOOGLE_DRIVE_FOLDER_ID = os.getenv('GOOGLE_DRIVE_FOLDER_ID')
-ALLOWED_USER_IDS = [int(id.strip()) for id in os.getenv('ALLOWED_USER_IDS', '').split(',') if id.strip()]
+ALLOWED_USER_IDS = frozenset(int(id.strip()) for id in os.getenv('ALLOWED_USER_IDS', '').split(',') if id.strip())
+
+# Google OAuth token from env (cloud deployment) - parsed once at import
+# A malformed secret falls back to data/token.json instead of failing at import
+_google_token_json = os.getenv('GOOGLE_TOKEN_JSON')
+GOOGLE_TOKEN_INFO = None
+if _google_token_json:
+    try:
+        GOOGLE_TOKEN_INFO = json.loads(_google_token_json)
+    except ValueError as e:
+        logger.warning(f"GOOGLE_TOKEN_JSON is not valid JSON, ignoring it: {e}")
 
 # Google Drive setup
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
+# Downloads above this size spill from RAM to a temp file on disk
+SPOOL_MAX_SIZE = 2 * 1024 * 1024  # 2MB
+
+# Upload chunk size - large enough that a typical voice/audio file goes up in one PUT
+DRIVE_UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024  # 16MB
+
+# Smaller files go up as a single multipart request (no resumable session setup)
+DRIVE_RESUMABLE_THRESHOLD = 5 * 1024 * 1024  # 5MB
+
+
+# Cached Drive client - built once, credentials refreshed in place
+_drive_service = None
+_drive_creds = None
+_drive_lock = threading.Lock()
+
+# Per-thread authorized HTTP client so uploads reuse keep-alive connections
+# (httplib2.Http is not thread-safe, and uploads run in worker threads)
+_drive_http_local = threading.local()
+
 
 def get_drive_service():
-    """Get authenticated Google Drive service."""
-    creds = None
+    """Get authenticated Google Drive service (cached across requests)."""
+    global _drive_service, _drive_creds
+    
+    with _drive_lock:
+        if _drive_service is None:
+            creds = None
+            
+            # Try environment variable first (for cloud deployment)
+            if GOOGLE_TOKEN_INFO:
+                creds = Credentials.from_authorized_user_info(GOOGLE_TOKEN_INFO, SCOPES)
+            
+            # Fallback to file
+            token_file = Path('data/token.json')
+            if not creds and token_file.exists():
+                creds = Credentials.from_authorized_user_file(str(token_file), SCOPES)
+            
+            if not creds:
+                raise ValueError("No valid Google credentials found")
+            
+            _drive_creds = creds
+            _drive_service = build(
+                'drive', 'v3',
+                credentials=creds,
+                cache_discovery=False,
+                static_discovery=True
+            )
+        
+        # Refresh if needed
+        if _drive_creds.expired and _drive_creds.refresh_token:
+            _drive_creds.refresh(Request())
+        
+        return _drive_service
+
+
+def _get_drive_http() -> AuthorizedHttp:
+    """Get this thread's pooled, authorized HTTP client for Drive requests."""
+    http = getattr(_drive_http_local, 'http', None)
+    if http is None:
+        get_drive_service()  # Make sure credentials are loaded
+        http = AuthorizedHttp(_drive_creds, http=httplib2.Http(timeout=30))
+        _drive_http_local.http = http
+    return http
+
+
+def upload_to_drive(file_obj, filename: str, mimetype: str) -> dict:
+    """
+    Upload a file object to the Drive folder. Blocking (httplib2) - call it via
+    asyncio.to_thread() so the event loop keeps serving other updates.
+    """
+    drive_service = get_drive_service()
+    
+    file_metadata = {
+        'name': filename,
+        'parents': [GOOGLE_DRIVE_FOLDER_ID]
+    }
+    
+    # Voice notes are usually well under the threshold - one round trip instead of 2-3
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(0)
+    
+    media = MediaIoBaseUpload(
+        file_obj,
+        mimetype=mimetype,
+        resumable=size >= DRIVE_RESUMABLE_THRESHOLD,
+        chunksize=DRIVE_UPLOAD_CHUNK_SIZE
+    )
+    
+    return drive_service.files().create(
+        body=file_metadata,
+        media_body=media,
+        fields='id,name'
+    ).execute(http=_get_drive_http(), num_retries=5)
+
+
+async def download_to_spool(file) -> tempfile.SpooledTemporaryFile:
+    """Download a Telegram file into a spooled temp file, rewound and ready to upload."""
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    await file.download_to_memory(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+# =========================================================================
+# MEDIA GROUPS - albums of audio files are uploaded to Drive as one batch
+# =========================================================================
+
+# Mirrored in main_webhook.py: the polling and webhook entry points are deployed and run
+# independently, so each carries its own copy of the Drive helpers - keep them in sync.
+
+# Telegram delivers each album item as its own update; wait this long after
+# the last item before uploading the whole group
+MEDIA_GROUP_WINDOW = 1.5  # seconds
+
+# Format: { media_group_id: {"items": [(file_obj, filename, mimetype)], "status_msg": Message,
+#                            "downloading": int, "errors": [str], "flush_task": Task} }
+_pending_media_groups = {}
+
+
+async def add_to_media_group(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                             media, filename: str, mimetype: str) -> None:
+    """Download one album item and queue it; the group is flushed once it stops growing."""
+    group_id = update.message.media_group_id
+    
+    group = _pending_media_groups.get(group_id)
+    if group is None:
+        # Register before awaiting so concurrent album items join this group
+        group = {'items': [], 'status_msg': None, 'downloading': 0, 'errors': [], 'flush_task': None}
+        _pending_media_groups[group_id] = group
+        try:
+            group['status_msg'] = await update.message.reply_text("🎵 Receiving audio files...")
+        except Exception as e:
+            # Keep the group - the files still get uploaded, just without a progress message
+            logger.error(f"Error acknowledging album {group_id}: {e}", exc_info=True)
     
-    # Try environment variable first (for cloud deployment)
-    token_json = os.getenv('GOOGLE_TOKEN_JSON')
-    if token_json:
-        import json
-        creds = Credentials.from_authorized_user_info(json.loads(token_json), SCOPES)
+    group['downloading'] += 1
+    try:
+        file = await context.bot.get_file(media.file_id)
+        group['items'].append((await download_to_spool(file), filename, mimetype))
+    except Exception as e:
+        logger.error(f"Error downloading album item {filename}: {e}", exc_info=True)
+        group['errors'].append(f"{filename}: {e}")
+    finally:
+        group['downloading'] -= 1
+    
+    # (Re)start the quiet-period timer
+    if group['flush_task']:
+        group['flush_task'].cancel()
+    group['flush_task'] = asyncio.create_task(_flush_media_group_later(group_id))
+
+
+async def _flush_media_group_later(group_id: str) -> None:
+    """Flush a media group once no new items arrived for MEDIA_GROUP_WINDOW seconds."""
+    await asyncio.sleep(MEDIA_GROUP_WINDOW)
     
-    # Fallback to file
-    token_file = Path('data/token.json')
-    if not creds and token_file.exists():
-        creds = Credentials.from_authorized_user_file(str(token_file), SCOPES)
+    group = _pending_media_groups.get(group_id)
+    if not group or group['downloading']:
+        return  # The last download to finish reschedules the flush
+    _pending_media_groups.pop(group_id, None)
     
-    # Refresh if needed
-    if creds and creds.expired and creds.refresh_token:
-        creds.refresh(Request())
+    items = group['items']
+    results = await asyncio.gather(
+        *(asyncio.to_thread(upload_to_drive, file_obj, filename, mimetype)
+          for file_obj, filename, mimetype in items),
+        return_exceptions=True
+    )
     
-    if not creds:
-        raise ValueError("No valid Google credentials found")
+    lines = []
+    uploaded = 0
+    for (file_obj, filename, _), result in zip(items, results):
+        file_obj.close()
+        if isinstance(result, Exception):
+            logger.error(f"Error uploading album item {filename}: {result}")
+            lines.append(f"❌ {filename}: {result}")
+        else:
+            logger.info(f"Uploaded to Drive: {result['name']}")
+            uploaded += 1
+            lines.append(f"📁 {filename}")
+    lines.extend(f"❌ {error}" for error in group['errors'])
     
-    return build('drive', 'v3', credentials=creds)
+    total = len(items) + len(group['errors'])
+    if group['status_msg'] is None:
+        logger.info(f"Album {group_id}: uploaded {uploaded}/{total} audio file(s), no status message to update")
+        return
+    try:
+        await group['status_msg'].edit_text(
+            f"✅ Uploaded {uploaded}/{total} audio file(s) to Drive\n\n" + "\n".join(lines)
+        )
+    except Exception as e:
+        logger.error(f"Error reporting album {group_id} upload: {e}", exc_info=True)
+
+
+# Static command replies - built once at import
+START_TEXT = (
+    "Hi {name}! 👋\n\n"
+    "I'm Jarvis, your voice memo assistant.\n\n"
+    "Send me a voice message and I'll process it for you:\n"
+    "• Transcribe it\n"
+    "• Extract key information\n"
+    "• Save it to your knowledge base\n\n"
+    "Just hold the microphone button and speak!"
+)
+
+HELP_TEXT = (
+    "🎙️ *How to use Jarvis:*\n\n"
+    "1. Send a voice message (hold mic button)\n"
+    "2. I'll upload it for processing\n"
+    "3. Check your Supabase/Notion for results\n\n"
+    "*Tips:*\n"
+    "• Speak clearly\n"
+    "• Start with context: 'Meeting with John...'\n"
+    "• Mention names and dates clearly"
+)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
     user = update.effective_user
     await update.message.reply_text(
-        f"Hi {user.first_name}! 👋\n\n"
-        "I'm Jarvis, your voice memo assistant.\n\n"
-        "Send me a voice message and I'll process it for you:\n"
-        "• Transcribe it\n"
-        "• Extract key information\n"
-        "• Save it to your knowledge base\n\n"
-        "Just hold the microphone button and speak!"
+        START_TEXT.format(name=user.first_name),
+        disable_web_page_preview=True
     )
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
     await update.message.reply_text(
-        "🎙️ *How to use Jarvis:*\n\n"
-        "1. Send a voice message (hold mic button)\n"
-        "2. I'll upload it for processing\n"
-        "3. Check your Supabase/Notion for results\n\n"
-        "*Tips:*\n"
-        "• Speak clearly\n"
-        "• Start with context: 'Meeting with John...'\n"
-        "• Mention names and dates clearly",
-        parse_mode='Markdown'
+        HELP_TEXT,
+        parse_mode='Markdown',
+        disable_web_page_preview=True
     )
 
 
@@ -96,124 +291,89 @@ def is_authorized(user_id: int) -> bool:
     return user_id in ALLOWED_USER_IDS
 
 
-async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle incoming voice messages."""
+async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle incoming voice messages and audio files (mp3, m4a, etc.)."""
     user = update.effective_user
+    message = update.message
+    is_voice = message.voice is not None
+    media = message.voice or message.audio
     
     # Check authorization
     if not is_authorized(user.id):
-        await update.message.reply_text("❌ Sorry, you're not authorized to use this bot.")
+        await message.reply_text("❌ Sorry, you're not authorized to use this bot.")
         logger.warning(f"Unauthorized access attempt from user {user.id} ({user.username})")
         return
     
-    voice = update.message.voice
-    logger.info(f"Received voice message from {user.username} ({user.id}): {voice.duration}s")
+    if is_voice:
+        logger.info(f"Received voice message from {user.username} ({user.id}): {media.duration}s")
+        filename = f"voice_{time.strftime('%Y-%m-%d_%H%M%S')}_{user.first_name}.ogg"
+        mimetype = 'audio/ogg'
+    else:
+        logger.info(f"Received audio file from {user.username}: {media.file_name}")
+        # Use original filename or generate one
+        filename = media.file_name or f"audio_{time.strftime('%Y-%m-%d_%H%M%S')}.mp3"
+        mimetype = media.mime_type or 'audio/mpeg'
+    
+    # Album items are uploaded together once the whole group has arrived
+    # (only audio files can be grouped - Telegram never sends voice notes as albums)
+    if message.media_group_id:
+        await add_to_media_group(update, context, media, filename, mimetype)
+        return
     
     # Send processing message
-    status_msg = await update.message.reply_text("🎙️ Receiving voice message...")
+    status_msg = await message.reply_text(
+        "🎙️ Receiving voice message..." if is_voice else "🎵 Receiving audio file..."
+    )
+    media_file = None
     
     try:
-        # Download voice file
-        file = await context.bot.get_file(voice.file_id)
-        voice_bytes = await file.download_as_bytearray()
+        # Download file
+        file = await context.bot.get_file(media.file_id)
+        media_file = await download_to_spool(file)
         
         await status_msg.edit_text("📤 Uploading to Google Drive...")
         
-        # Generate filename
-        timestamp = datetime.now().strftime('%Y-%m-%d_%H%M%S')
-        filename = f"voice_{timestamp}_{user.first_name}.ogg"
-        
-        # Upload to Google Drive
-        drive_service = get_drive_service()
-        
-        file_metadata = {
-            'name': filename,
-            'parents': [GOOGLE_DRIVE_FOLDER_ID]
-        }
-        
-        media = MediaIoBaseUpload(
-            io.BytesIO(voice_bytes),
-            mimetype='audio/ogg',
-            resumable=True
+        # Upload to Google Drive (off the event loop)
+        uploaded_file = await asyncio.to_thread(
+            upload_to_drive, media_file, filename, mimetype
         )
         
-        uploaded_file = drive_service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id,name'
-        ).execute()
-        
         logger.info(f"Uploaded to Drive: {uploaded_file['name']} (ID: {uploaded_file['id']})")
         
-        await status_msg.edit_text(
-            f"✅ Voice message uploaded!\n\n"
-            f"📁 File: `{filename}`\n"
-            f"⏱️ Duration: {voice.duration}s\n\n"
-            f"Processing will begin shortly. "
-            f"Check your knowledge base in a few minutes.",
-            parse_mode='Markdown'
-        )
+        if is_voice:
+            await status_msg.edit_text(
+                f"✅ Voice message uploaded!\n\n"
+                f"📁 File: `{filename}`\n"
+                f"⏱️ Duration: {media.duration}s\n\n"
+                f"Processing will begin shortly. "
+                f"Check your knowledge base in a few minutes.",
+                parse_mode='Markdown'
+            )
+        else:
+            await status_msg.edit_text(
+                f"✅ Audio file uploaded!\n\n"
+                f"📁 File: `{filename}`\n\n"
+                f"Processing will begin shortly.",
+                parse_mode='Markdown'
+            )
         
     except Exception as e:
-        logger.error(f"Error processing voice message: {e}", exc_info=True)
-        await status_msg.edit_text(f"❌ Error uploading voice message: {str(e)}")
+        kind = "voice message" if is_voice else "audio file"
+        logger.error(f"Error processing {kind}: {e}", exc_info=True)
+        await status_msg.edit_text(f"❌ Error uploading {kind}: {str(e)}")
+    finally:
+        if media_file is not None:
+            media_file.close()
 
 
-async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle audio files (mp3, m4a, etc.)."""
-    user = update.effective_user
-    
-    if not is_authorized(user.id):
-        await update.message.reply_text("❌ Sorry, you're not authorized to use this bot.")
-        return
-    
-    audio = update.message.audio
-    logger.info(f"Received audio file from {user.username}: {audio.file_name}")
-    
-    status_msg = await update.message.reply_text("🎵 Receiving audio file...")
-    
-    try:
-        # Download audio file
-        file = await context.bot.get_file(audio.file_id)
-        audio_bytes = await file.download_as_bytearray()
-        
-        await status_msg.edit_text("📤 Uploading to Google Drive...")
-        
-        # Use original filename or generate one
-        filename = audio.file_name or f"audio_{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.mp3"
-        
-        # Upload to Google Drive
-        drive_service = get_drive_service()
-        
-        file_metadata = {
-            'name': filename,
-            'parents': [GOOGLE_DRIVE_FOLDER_ID]
-        }
-        
-        media = MediaIoBaseUpload(
-            io.BytesIO(audio_bytes),
-            mimetype=audio.mime_type or 'audio/mpeg',
-            resumable=True
-        )
-        
-        uploaded_file = drive_service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id,name'
-        ).execute()
-        
-        logger.info(f"Uploaded to Drive: {uploaded_file['name']}")
-        
-        await status_msg.edit_text(
-            f"✅ Audio file uploaded!\n\n"
-            f"📁 File: `{filename}`\n\n"
-            f"Processing will begin shortly.",
-            parse_mode='Markdown'
-        )
-        
-    except Exception as e:
-        logger.error(f"Error processing audio file: {e}", exc_info=True)
-        await status_msg.edit_text(f"❌ Error: {str(e)}")
+def build_telegram_request() -> HTTPXRequest:
+    """Pooled HTTP/2 client for Bot API calls and file downloads (getFile + download share a connection)."""
+    return HTTPXRequest(
+        connection_pool_size=256,  # PTB 20.x defaults to a single connection
+        read_timeout=30,
+        write_timeout=30,
+        http_version="2"
+    )
 
 
 def main() -> None:
@@ -224,14 +384,22 @@ def main() -> None:
     if not GOOGLE_DRIVE_FOLDER_ID:
         raise ValueError("GOOGLE_DRIVE_FOLDER_ID not set")
     
+    # Warm the Drive client so the first upload doesn't pay for it
+    get_drive_service()
+    
     # Create application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .request(build_telegram_request())
+        .get_updates_request(build_telegram_request())
+        .build()
+    )
     
     # Add handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(MessageHandler(filters.VOICE, handle_voice))
-    application.add_handler(MessageHandler(filters.AUDIO, handle_audio))
+    application.add_handler(MessageHandler(filters.VOICE | filters.AUDIO, handle_media))
     
     # Start the bot
     logger.info("Starting Jarvis Telegram bot...")
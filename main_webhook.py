@@ -6,24 +6,33 @@ Supports non-blocking async processing for long audio files.
 """
 
 import os
-import io
-import json
+import orjson
 import logging
 import httpx
 import hashlib
+import hmac
+import random
+import secrets
 import time
 import requests
 import asyncio
-from datetime import datetime
-from typing import Optional
+import tempfile
+import threading
+import httplib2
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.request import HTTPXRequest
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request as GoogleAuthRequest
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 from fastapi import FastAPI, Request, Response, HTTPException, BackgroundTasks
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 
@@ -33,26 +42,63 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+# httpx logs every request URL at INFO - Telegram URLs embed the bot token
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # Configuration
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '').strip()  # Strip any whitespace from secret
 GOOGLE_DRIVE_FOLDER_ID = os.getenv('GOOGLE_DRIVE_FOLDER_ID', '').strip()
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # e.g., https://your-bot.run.app
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '').strip()  # Sent back by Telegram in X-Telegram-Bot-Api-Secret-Token
+# Parallel webhook deliveries Telegram may open (default 40) - keep in line with Cloud Run --concurrency
+WEBHOOK_MAX_CONNECTIONS = 100
+# Only the update types we have handlers for (messages incl. location, inline button presses)
+WEBHOOK_ALLOWED_UPDATES = ["message", "callback_query"]
 AUDIO_PIPELINE_URL = os.getenv('AUDIO_PIPELINE_URL', '').strip()  # e.g., https://jarvis-audio-pipeline-xxx.run.app
 INTELLIGENCE_SERVICE_URL = os.getenv('INTELLIGENCE_SERVICE_URL', '').strip()  # For contact operations
 SYNC_SERVICE_URL = os.getenv('SYNC_SERVICE_URL', '').strip()  # For triggering syncs
-ALLOWED_USER_IDS = [int(id.strip()) for id in os.getenv('ALLOWED_USER_IDS', '').split(',') if id.strip()]
+# Let the pipeline download audio from Telegram itself (POST /process/url) instead of
+# proxying the bytes through the bot. Opt-in: the file URL contains the bot token.
+PIPELINE_FETCHES_AUDIO = os.getenv('PIPELINE_FETCHES_AUDIO', '').strip().lower() in ('1', 'true', 'yes')
+ALLOWED_USER_IDS = frozenset(int(id.strip()) for id in os.getenv('ALLOWED_USER_IDS', '').split(',') if id.strip())
+
+# Google OAuth token - parsed once at import instead of on every Drive client build
+# A malformed secret only disables the Drive fallback - it must not stop the service
+_google_token_json = os.getenv('GOOGLE_TOKEN_JSON')
+GOOGLE_TOKEN_INFO = None
+if _google_token_json:
+    try:
+        GOOGLE_TOKEN_INFO = orjson.loads(_google_token_json)
+    except orjson.JSONDecodeError as e:
+        logger.warning(f"GOOGLE_TOKEN_JSON is not valid JSON, Google Drive disabled: {e}")
 
 # Global bot application
 bot_app = None
 
+# Shared HTTP client for the pipeline, intelligence and sync services (and
+# streamed Drive uploads) - one keep-alive pool instead of a client per request.
+# Created in lifespan(); calls needing longer limits pass timeout= per request.
+http_client: httpx.AsyncClient | None = None
+
+# Per-phase timeouts: keep connect/pool short so a dead backend surfaces quickly,
+# and give writes room so multi-MB audio uploads don't hit WriteTimeout.
+SERVICE_TIMEOUT = httpx.Timeout(connect=5.0, read=30.0, write=20.0, pool=5.0)
+CHAT_TIMEOUT = httpx.Timeout(connect=5.0, read=120.0, write=20.0, pool=5.0)
+SYNC_TIMEOUT = httpx.Timeout(connect=10.0, read=300.0, write=20.0, pool=10.0)
+# Pipeline transcribes before responding (2h of audio = ~30 min), hence the long read
+PIPELINE_UPLOAD_TIMEOUT = httpx.Timeout(connect=10.0, read=3600.0, write=300.0, pool=10.0)
+DRIVE_STREAM_TIMEOUT = httpx.Timeout(connect=10.0, read=120.0, write=300.0, pool=10.0)
+
 # Supabase client for chat history persistence
 SUPABASE_URL = os.getenv('SUPABASE_URL', '').strip()
 SUPABASE_KEY = os.getenv('SUPABASE_KEY', '').strip()
 
 # Store pending contact actions (in-memory, good enough for single instance)
-# Format: { "short_key": {"meeting_id": ..., "searched_name": ..., ...} }
-pending_contact_actions = {}
+# Bounded with a TTL - buttons that are never pressed would otherwise pile up forever
+# Format: { "short_key": (created_at, {"meeting_id": ..., "searched_name": ..., ...}) }
+CONTACT_ACTION_TTL = 60 * 60  # seconds - inline buttons are rarely used after an hour
+CONTACT_ACTION_MAX_SIZE = 1024
+pending_contact_actions = OrderedDict()
 
 
 def get_identity_token(audience: str) -> Optional[str]:
@@ -87,18 +133,19 @@ def get_auth_headers(service_url: str) -> dict:
     return headers# Store users waiting to type a contact name or selection
 # Format: { user_id: {"pending_links": [...], "current_index": 0} }
 # pending_links is a queue of unmatched contacts to process one by one
-pending_contact_creation = {}
+# Capped per user (oldest dropped) - with open access any sender could add entries
+PENDING_CONTACT_MAX_USERS = 1024
+pending_contact_creation = OrderedDict()
 
 # Track recently processed file IDs to prevent duplicates (TTL ~5 minutes)
-# Format: { file_unique_id: timestamp }
-recently_processed_files = {}
+# Format: { file_unique_id: timestamp } - insertion order is time order
+DUPLICATE_WINDOW = 300  # seconds
+DUPLICATE_MAX_ENTRIES = 10000
+recently_processed_files = OrderedDict()
 
 # How many messages to show AI (stored permanently, but only last N used for context)
 MAX_HISTORY_FOR_AI = 10
 
-# Counter for generating short callback keys (avoids 64-byte Telegram limit)
-_callback_counter = 0
-
 # Background processing queue - tracks audio files being processed
 # Format: { file_unique_id: {"chat_id": int, "user_id": int, "filename": str, "started_at": float} }
 background_processing = {}
@@ -107,24 +154,115 @@ background_processing = {}
 _processing_lock = asyncio.Lock()
 
 # Semaphore to limit concurrent audio processing (prevent overwhelming the pipeline)
-# Allows 3 concurrent processing tasks - more would overload Modal GPU
-MAX_CONCURRENT_AUDIO = 3
+# Allows 3 concurrent processing tasks by default - more would overload Modal GPU
+MAX_CONCURRENT_AUDIO = int(os.getenv('PIPELINE_CONCURRENCY', '3'))
 _audio_semaphore = asyncio.Semaphore(MAX_CONCURRENT_AUDIO)
 
+# Threads for asyncio.to_thread() (Drive uploads, credential refresh). The default
+# pool is min(32, cpus + 4) - on a 1-2 vCPU Cloud Run instance that's 5-6 uploads at once.
+BLOCKING_IO_THREADS = 64
+
+# Webhook updates are processed in the background after Telegram gets its 200.
+# The semaphore bounds how many run at once; the set keeps strong references
+# so pending tasks aren't garbage collected.
+MAX_CONCURRENT_UPDATES = 32
+_update_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPDATES)
+_update_tasks = set()
+
+# Audio jobs outlive the update that started them - held here for the same reason
+# and drained on shutdown alongside _update_tasks
+_audio_tasks = set()
+
+# Cloud Run allows ~10s between SIGTERM and SIGKILL - leave time to close clients
+SHUTDOWN_DRAIN_TIMEOUT = 8.0  # seconds
+
 def _short_key(prefix: str) -> str:
-    """Generate a short unique callback key to stay under Telegram's 64-byte limit."""
-    global _callback_counter
-    _callback_counter += 1
-    return f"{prefix}:{_callback_counter}"
+    """
+    Generate a short opaque callback key (well under Telegram's 64-byte limit).
+    Random rather than a counter, so buttons sent before a restart can't collide
+    with actions created after it.
+    """
+    return f"{prefix}:{secrets.token_urlsafe(8)}"
+
+
+def _store_contact_action(key: str, data: dict) -> None:
+    """Remember the action behind an inline button, evicting expired/oldest entries."""
+    now = time.monotonic()
+    pending_contact_actions[key] = (now, data)
+    # Insertion order is creation order, so the oldest entries are always at the front
+    while pending_contact_actions:
+        created_at, _ = next(iter(pending_contact_actions.values()))
+        if now - created_at < CONTACT_ACTION_TTL and len(pending_contact_actions) <= CONTACT_ACTION_MAX_SIZE:
+            break
+        pending_contact_actions.popitem(last=False)
+
+
+def _get_contact_action(key: str) -> dict | None:
+    """Look up the action behind an inline button (None if unknown or expired)."""
+    entry = pending_contact_actions.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] >= CONTACT_ACTION_TTL:
+        pending_contact_actions.pop(key, None)
+        return None
+    return entry[1]
+
+
+def _set_pending_contact_creation(user_id: int, data: dict) -> None:
+    """Start a contact-linking flow for a user, evicting the least recently started ones."""
+    pending_contact_creation[user_id] = data
+    pending_contact_creation.move_to_end(user_id)
+    while len(pending_contact_creation) > PENDING_CONTACT_MAX_USERS:
+        pending_contact_creation.popitem(last=False)
+
 
+# Recent contact-search hits, keyed by the normalized query - retyping a name (or the
+# same name for several meetings) doesn't re-query. Only non-empty results are kept,
+# so a miss never hides a contact created in the meantime.
+CONTACT_SEARCH_TTL = 60  # seconds
+CONTACT_SEARCH_MAX_SIZE = 512
+_contact_search_cache = OrderedDict()  # { query: (fetched_at, contacts) }
 
-def _get_conversation_history(user_id: int) -> list:
+
+async def _search_contacts(query: str, auth_headers: dict) -> list:
+    """Search the intelligence service for contacts matching a typed name."""
+    key = query.strip().casefold()
+    now = time.monotonic()
+    cached = _contact_search_cache.get(key)
+    if cached and now - cached[0] < CONTACT_SEARCH_TTL:
+        return cached[1]
+    
+    search_response = await http_client.get(
+        f"{INTELLIGENCE_SERVICE_URL}/api/v1/contacts/search",
+        params={"q": query, "limit": 5},
+        headers=auth_headers
+    )
+    if search_response.status_code != 200:
+        return []
+    
+    contacts = orjson.loads(search_response.content).get('contacts', [])
+    if contacts:
+        _contact_search_cache[key] = (now, contacts)
+        _contact_search_cache.move_to_end(key)
+        while len(_contact_search_cache) > CONTACT_SEARCH_MAX_SIZE:
+            _contact_search_cache.popitem(last=False)
+    return contacts
+
+
+def _drop_meeting_actions(meeting_id) -> None:
+    """Forget every pending button for a meeting (e.g. after the user skips it)."""
+    stale = [key for key, (_, data) in pending_contact_actions.items() if data.get('meeting_id') == meeting_id]
+    for key in stale:
+        pending_contact_actions.pop(key, None)
+
+
+async def _get_conversation_history(user_id: int) -> list:
     """Get conversation history from Supabase (last N messages for AI context)."""
     if not SUPABASE_URL or not SUPABASE_KEY:
         return []
     
     try:
-        response = httpx.get(
+        response = await http_client.get(
             f"{SUPABASE_URL}/rest/v1/chat_messages",
             headers={
                 'apikey': SUPABASE_KEY,
@@ -140,7 +278,7 @@ def _get_conversation_history(user_id: int) -> list:
         )
         
         if response.status_code == 200:
-            messages = response.json()
+            messages = orjson.loads(response.content)
             # Reverse to get chronological order (oldest first)
             return list(reversed(messages))
         else:
@@ -151,7 +289,7 @@ def _get_conversation_history(user_id: int) -> list:
         return []
 
 
-def _add_to_conversation_history(user_id: int, role: str, content: str, tools_used: list = None) -> None:
+async def _add_to_conversation_history(user_id: int, role: str, content: str, tools_used: list = None) -> None:
     """Save a message to Supabase chat_messages table (permanent storage)."""
     if not SUPABASE_URL or not SUPABASE_KEY:
         return
@@ -166,7 +304,7 @@ def _add_to_conversation_history(user_id: int, role: str, content: str, tools_us
         if tools_used:
             payload["tools_used"] = tools_used
         
-        httpx.post(
+        await http_client.post(
             f"{SUPABASE_URL}/rest/v1/chat_messages",
             headers={
                 'apikey': SUPABASE_KEY,
@@ -247,13 +385,14 @@ def _build_voice_memo_history_entry(details: dict, summary: str, category: str =
 
 def _is_duplicate_file(file_unique_id: str) -> bool:
     """Check if file was recently processed (deduplication)."""
-    import time
-    now = time.time()
+    now = time.monotonic()
     
-    # Clean up old entries (older than 5 minutes)
-    expired = [k for k, v in recently_processed_files.items() if now - v > 300]
-    for k in expired:
-        recently_processed_files.pop(k, None)
+    # Clean up old entries - oldest first, so stop at the first one still in the window
+    while recently_processed_files:
+        oldest_seen = next(iter(recently_processed_files.values()))
+        if now - oldest_seen <= DUPLICATE_WINDOW:
+            break
+        recently_processed_files.popitem(last=False)
     
     # Check if already processed
     if file_unique_id in recently_processed_files:
@@ -261,62 +400,282 @@ def _is_duplicate_file(file_unique_id: str) -> bool:
     
     # Mark as processed
     recently_processed_files[file_unique_id] = now
+    if len(recently_processed_files) > DUPLICATE_MAX_ENTRIES:
+        recently_processed_files.popitem(last=False)
     return False
 
 # Google Drive setup - use same scope as the token
 SCOPES = ['https://www.googleapis.com/auth/drive']
 
+# Downloads above this size spill from RAM to a temp file on disk
+SPOOL_MAX_SIZE = 2 * 1024 * 1024  # 2MB
+
+# Upload chunk size - large enough that a typical voice/audio file goes up in one PUT
+DRIVE_UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024  # 16MB
+
+# Smaller files go up as a single multipart request (no resumable session setup)
+DRIVE_RESUMABLE_THRESHOLD = 5 * 1024 * 1024  # 5MB
+
+# Larger files are streamed Telegram -> Drive through a resumable session in
+# chunks of this size (must be a multiple of 256KB)
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+DRIVE_STREAM_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB
+DRIVE_STREAM_MAX_ATTEMPTS = 3  # per chunk PUT, retried on 5xx
+
+
+# Cached Drive client - built once, credentials refreshed in place
+# (the service holds the Credentials by reference, so a refresh is picked up)
+_drive_service = None
+_drive_creds = None
+_drive_lock = threading.Lock()
+
+# Per-thread authorized HTTP client so uploads reuse keep-alive connections
+# (httplib2.Http is not thread-safe, and uploads run in worker threads)
+_drive_http_local = threading.local()
+
 
 def get_drive_service():
-    """Get authenticated Google Drive service."""
-    token_json = os.getenv('GOOGLE_TOKEN_JSON')
-    if not token_json:
-        raise ValueError("GOOGLE_TOKEN_JSON not set")
+    """Get authenticated Google Drive service (cached across requests)."""
+    global _drive_service, _drive_creds
+    
+    with _drive_lock:
+        if _drive_service is None:
+            if not GOOGLE_TOKEN_INFO:
+                raise ValueError("GOOGLE_TOKEN_JSON not set")
+            
+            _drive_creds = Credentials.from_authorized_user_info(GOOGLE_TOKEN_INFO, SCOPES)
+            # Bundled discovery document - no network fetch, no file-cache warning
+            _drive_service = build(
+                'drive', 'v3',
+                credentials=_drive_creds,
+                cache_discovery=False,
+                static_discovery=True
+            )
+        
+        # Refresh if needed
+        if _drive_creds.expired and _drive_creds.refresh_token:
+            _drive_creds.refresh(GoogleAuthRequest())
+        
+        return _drive_service
+
+
+def _get_drive_http() -> AuthorizedHttp:
+    """Get this thread's pooled, authorized HTTP client for Drive requests."""
+    http = getattr(_drive_http_local, 'http', None)
+    if http is None:
+        get_drive_service()  # Make sure credentials are loaded
+        http = AuthorizedHttp(_drive_creds, http=httplib2.Http(timeout=30))
+        _drive_http_local.http = http
+    return http
+
+
+def warm_drive_connection() -> None:
+    """
+    Build the Drive client and make one cheap authenticated call, so credentials
+    are refreshed and a TLS connection is open before the first upload.
+    """
+    get_drive_service().about().get(fields='user').execute(http=_get_drive_http())
+
+
+def upload_to_drive(file_obj, filename: str, mimetype: str) -> dict:
+    """
+    Upload a file object to the Drive folder. Blocking (httplib2) - call it via
+    asyncio.to_thread() so the event loop keeps serving other updates.
+    """
+    drive_service = get_drive_service()
+    
+    file_metadata = {
+        'name': filename,
+        'parents': [GOOGLE_DRIVE_FOLDER_ID]
+    }
     
-    creds = Credentials.from_authorized_user_info(json.loads(token_json), SCOPES)
+    # Voice notes are usually well under the threshold - one round trip instead of 2-3
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(0)
     
-    # Refresh if needed
-    if creds.expired and creds.refresh_token:
-        creds.refresh(GoogleAuthRequest())
+    media = MediaIoBaseUpload(
+        file_obj,
+        mimetype=mimetype,
+        resumable=size >= DRIVE_RESUMABLE_THRESHOLD,
+        chunksize=DRIVE_UPLOAD_CHUNK_SIZE
+    )
     
-    return build('drive', 'v3', credentials=creds)
+    return drive_service.files().create(
+        body=file_metadata,
+        media_body=media,
+        fields='id,name'
+    ).execute(http=_get_drive_http(), num_retries=5)
+
+
+def _get_drive_access_token() -> str:
+    """Get a valid OAuth access token for direct Drive REST calls (blocking - may refresh)."""
+    get_drive_service()  # Loads the credentials and refreshes them if expired
+    return _drive_creds.token
+
+
+def _drive_persisted_offset(response: httpx.Response) -> int:
+    """Bytes Drive has stored so far, from a 308's Range header ("bytes=0-N"); absent means none."""
+    range_header = response.headers.get("Range")
+    if not range_header:
+        return 0
+    return int(range_header.rsplit("-", 1)[1]) + 1
+
+
+async def _put_drive_chunk(upload_url: str, chunk: bytes, offset: int, total: int | None = None) -> httpx.Response:
+    """PUT bytes starting at offset into a resumable session, retrying 5xx answers with jittered backoff."""
+    size = "*" if total is None else total
+    content_range = f"bytes {offset}-{offset + len(chunk) - 1}/{size}" if chunk else f"bytes */{size}"
+    for attempt in range(DRIVE_STREAM_MAX_ATTEMPTS):
+        response = await http_client.put(
+            upload_url,
+            content=chunk,
+            headers={"Content-Range": content_range},
+            timeout=DRIVE_STREAM_TIMEOUT
+        )
+        if response.status_code < 500 or attempt == DRIVE_STREAM_MAX_ATTEMPTS - 1:
+            return response
+        delay = 2 ** attempt * random.uniform(0.5, 1.5)
+        logger.warning(f"Drive chunk upload returned {response.status_code}, retrying in {delay:.1f}s (attempt {attempt + 1}/{DRIVE_STREAM_MAX_ATTEMPTS})")
+        await asyncio.sleep(delay)
+
+
+async def stream_to_drive(file, filename: str, mimetype: str) -> dict:
+    """
+    Stream a Telegram file straight into a Drive resumable upload session.
+    
+    The download and upload overlap and only one chunk is held in memory, so
+    large files are never materialized in full.
+    """
+    access_token = await asyncio.to_thread(_get_drive_access_token)
+    
+    # Open the resumable session - Drive returns the session URL in Location
+    session_response = await http_client.post(
+        DRIVE_UPLOAD_URL,
+        params={"uploadType": "resumable", "fields": "id,name"},
+        json={"name": filename, "parents": [GOOGLE_DRIVE_FOLDER_ID]},
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "X-Upload-Content-Type": mimetype
+        },
+        timeout=DRIVE_STREAM_TIMEOUT
+    )
+    session_response.raise_for_status()
+    upload_url = session_response.headers["Location"]
+    
+    buffer = bytearray()
+    offset = 0
+    async with http_client.stream("GET", file.file_path, timeout=DRIVE_STREAM_TIMEOUT) as download:
+        download.raise_for_status()
+        async for data in download.aiter_bytes():
+            buffer += data
+            while len(buffer) >= DRIVE_STREAM_CHUNK_SIZE:
+                chunk = bytes(buffer[:DRIVE_STREAM_CHUNK_SIZE])
+                del buffer[:DRIVE_STREAM_CHUNK_SIZE]
+                # Total size unknown until the download ends - Drive answers 308
+                response = await _put_drive_chunk(upload_url, chunk, offset)
+                if response.status_code != 308:
+                    raise Exception(f"Drive chunk upload failed: HTTP {response.status_code}")
+                # Drive may store only part of a chunk - the rest goes back in front of the buffer
+                persisted = _drive_persisted_offset(response)
+                if persisted <= offset:
+                    raise Exception("Drive chunk upload made no progress")
+                buffer[:0] = chunk[persisted - offset:]
+                offset = persisted
+    
+    # The final request carries the total size, which completes the upload
+    total = offset + len(buffer)
+    while True:
+        response = await _put_drive_chunk(upload_url, bytes(buffer), offset, total)
+        if response.status_code != 308:
+            break
+        persisted = _drive_persisted_offset(response)
+        if persisted <= offset:
+            raise Exception("Drive final upload made no progress")
+        del buffer[:persisted - offset]
+        offset = persisted
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+# Telegram file links stay valid for at least an hour - cache getFile results so
+# a file that is sent again (same file_id) skips the Bot API round trip
+FILE_CACHE_TTL = 50 * 60  # seconds
+FILE_CACHE_MAX_SIZE = 256
+_file_cache = OrderedDict()  # { file_id: (fetched_at, File) }
+
+
+async def get_file_cached(bot, file_id: str):
+    """Bot.get_file() backed by a small in-process LRU keyed by file_id."""
+    now = time.monotonic()
+    cached = _file_cache.get(file_id)
+    if cached and now - cached[0] < FILE_CACHE_TTL:
+        _file_cache.move_to_end(file_id)
+        return cached[1]
+    
+    file = await bot.get_file(file_id)
+    _file_cache[file_id] = (now, file)
+    _file_cache.move_to_end(file_id)
+    while len(_file_cache) > FILE_CACHE_MAX_SIZE:
+        _file_cache.popitem(last=False)
+    return file
+
+
+async def download_to_spool(file) -> tempfile.SpooledTemporaryFile:
+    """Download a Telegram file into a spooled temp file, rewound and ready to upload."""
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    await file.download_to_memory(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+# Static command replies - built once at import
+START_TEXT = (
+    "Hi {name}! 👋\n\n"
+    "I'm Jarvis, your voice memo assistant.\n\n"
+    "Send me a voice message and I'll process it for you:\n"
+    "• Transcribe it\n"
+    "• Extract key information\n"
+    "• Save it to your knowledge base\n\n"
+    "Just hold the microphone button and speak!"
+)
+
+HELP_TEXT = (
+    "🤖 *Jarvis - Your Personal AI Assistant*\n\n"
+    "*Voice Messages:*\n"
+    "🎙️ Send a voice memo and I'll:\n"
+    "• Transcribe it\n"
+    "• Extract meetings, tasks, reflections\n"
+    "• Save to your knowledge base\n\n"
+    "*Chat with Your Data:*\n"
+    "💬 Just type a message to:\n"
+    "• Ask questions: _'When did I last meet John?'_\n"
+    "• Search: _'What tasks are pending?'_\n"
+    "• Create: _'Add task: call dentist'_\n"
+    "• Query: _'What meetings this week?'_\n\n"
+    "*Commands:*\n"
+    "/process - Check & process Google Drive audios\n"
+    "/sync - Trigger full data sync\n"
+    "/help - Show this message\n"
+    "/cancel - Cancel current operation"
+)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
     user = update.effective_user
     await update.message.reply_text(
-        f"Hi {user.first_name}! 👋\n\n"
-        "I'm Jarvis, your voice memo assistant.\n\n"
-        "Send me a voice message and I'll process it for you:\n"
-        "• Transcribe it\n"
-        "• Extract key information\n"
-        "• Save it to your knowledge base\n\n"
-        "Just hold the microphone button and speak!"
+        START_TEXT.format(name=user.first_name),
+        disable_web_page_preview=True
     )
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
     await update.message.reply_text(
-        "🤖 *Jarvis - Your Personal AI Assistant*\n\n"
-        "*Voice Messages:*\n"
-        "🎙️ Send a voice memo and I'll:\n"
-        "• Transcribe it\n"
-        "• Extract meetings, tasks, reflections\n"
-        "• Save to your knowledge base\n\n"
-        "*Chat with Your Data:*\n"
-        "💬 Just type a message to:\n"
-        "• Ask questions: _'When did I last meet John?'_\n"
-        "• Search: _'What tasks are pending?'_\n"
-        "• Create: _'Add task: call dentist'_\n"
-        "• Query: _'What meetings this week?'_\n\n"
-        "*Commands:*\n"
-        "/process - Check & process Google Drive audios\n"
-        "/sync - Trigger full data sync\n"
-        "/help - Show this message\n"
-        "/cancel - Cancel current operation",
-        parse_mode='Markdown'
+        HELP_TEXT,
+        parse_mode='Markdown',
+        disable_web_page_preview=True
     )
 
 
@@ -354,102 +713,101 @@ async def process_audios_command(update: Update, context: ContextTypes.DEFAULT_T
     
     try:
         auth_headers = get_auth_headers(AUDIO_PIPELINE_URL)
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # First, check what files are in the inbox
-            files_response = await client.get(
-                f"{AUDIO_PIPELINE_URL}/files",
-                headers=auth_headers
+        # First, check what files are in the inbox
+        files_response = await http_client.get(
+            f"{AUDIO_PIPELINE_URL}/files",
+            headers=auth_headers
+        )
+        
+        if files_response.status_code != 200:
+            await status_msg.edit_text(f"❌ Failed to check files: HTTP {files_response.status_code}")
+            return
+        
+        files_data = orjson.loads(files_response.content)
+        files = files_data.get('files', [])
+        count = files_data.get('count', 0)
+        
+        if count == 0:
+            await status_msg.edit_text(
+                "📂 *Google Drive Inbox*\n\n"
+                "No audio files found.\n\n"
+                "_Files are automatically processed when you upload to the Audio Files folder._",
+                parse_mode='Markdown'
             )
-            
-            if files_response.status_code != 200:
-                await status_msg.edit_text(f"❌ Failed to check files: HTTP {files_response.status_code}")
-                return
-            
-            files_data = files_response.json()
-            files = files_data.get('files', [])
-            count = files_data.get('count', 0)
-            
-            if count == 0:
+            return
+        
+        # Show files found
+        file_list = "\n".join([f"• `{f['name']}`" for f in files[:10]])
+        if count > 10:
+            file_list += f"\n_...and {count - 10} more_"
+        
+        await status_msg.edit_text(
+            f"📂 *Google Drive Inbox*\n\n"
+            f"Found {count} audio file(s):\n{file_list}\n\n"
+            f"⏳ Starting processing...",
+            parse_mode='Markdown'
+        )
+        
+        # Check current status (is something already processing?)
+        queue_response = await http_client.get(
+            f"{AUDIO_PIPELINE_URL}/queue",
+            headers=auth_headers
+        )
+        
+        if queue_response.status_code == 200:
+            queue_data = orjson.loads(queue_response.content)
+            if queue_data.get('status') == 'processing':
+                current = queue_data.get('current_file', 'unknown file')
+                elapsed = queue_data.get('elapsed_display', 'unknown')
                 await status_msg.edit_text(
-                    "📂 *Google Drive Inbox*\n\n"
-                    "No audio files found.\n\n"
-                    "_Files are automatically processed when you upload to the Audio Files folder._",
+                    f"📂 *Google Drive Inbox*\n\n"
+                    f"Found {count} audio file(s):\n{file_list}\n\n"
+                    f"⏳ Already processing: `{current}`\n"
+                    f"Time elapsed: {elapsed}\n\n"
+                    f"_New files will be queued automatically._",
                     parse_mode='Markdown'
                 )
                 return
+        
+        # Trigger processing in background mode
+        process_response = await http_client.post(
+            f"{AUDIO_PIPELINE_URL}/process",
+            params={"background": "true"},
+            headers=auth_headers
+        )
+        
+        if process_response.status_code == 200:
+            result = orjson.loads(process_response.content)
+            status = result.get('status', 'unknown')
             
-            # Show files found
-            file_list = "\n".join([f"• `{f['name']}`" for f in files[:10]])
-            if count > 10:
-                file_list += f"\n_...and {count - 10} more_"
-            
-            await status_msg.edit_text(
-                f"📂 *Google Drive Inbox*\n\n"
-                f"Found {count} audio file(s):\n{file_list}\n\n"
-                f"⏳ Starting processing...",
-                parse_mode='Markdown'
-            )
-            
-            # Check current status (is something already processing?)
-            queue_response = await client.get(
-                f"{AUDIO_PIPELINE_URL}/queue",
-                headers=auth_headers
-            )
-            
-            if queue_response.status_code == 200:
-                queue_data = queue_response.json()
-                if queue_data.get('status') == 'processing':
-                    current = queue_data.get('current_file', 'unknown file')
-                    elapsed = queue_data.get('elapsed_display', 'unknown')
-                    await status_msg.edit_text(
-                        f"📂 *Google Drive Inbox*\n\n"
-                        f"Found {count} audio file(s):\n{file_list}\n\n"
-                        f"⏳ Already processing: `{current}`\n"
-                        f"Time elapsed: {elapsed}\n\n"
-                        f"_New files will be queued automatically._",
-                        parse_mode='Markdown'
-                    )
-                    return
-            
-            # Trigger processing in background mode
-            process_response = await client.post(
-                f"{AUDIO_PIPELINE_URL}/process",
-                params={"background": "true"},
-                headers=auth_headers
-            )
-            
-            if process_response.status_code == 200:
-                result = process_response.json()
-                status = result.get('status', 'unknown')
-                
-                if status == 'accepted':
-                    await status_msg.edit_text(
-                        f"📂 *Google Drive Inbox*\n\n"
-                        f"Found {count} audio file(s):\n{file_list}\n\n"
-                        f"✅ Processing started!\n\n"
-                        f"_You'll receive notifications as each file is processed._",
-                        parse_mode='Markdown'
-                    )
-                elif status == 'already_processing':
-                    await status_msg.edit_text(
-                        f"📂 *Google Drive Inbox*\n\n"
-                        f"Found {count} audio file(s):\n{file_list}\n\n"
-                        f"⏳ Processing already in progress.\n"
-                        f"_Files will be processed in queue._",
-                        parse_mode='Markdown'
-                    )
-                else:
-                    await status_msg.edit_text(
-                        f"📂 *Google Drive Inbox*\n\n"
-                        f"Found {count} file(s):\n{file_list}\n\n"
-                        f"Status: {status}",
-                        parse_mode='Markdown'
-                    )
+            if status == 'accepted':
+                await status_msg.edit_text(
+                    f"📂 *Google Drive Inbox*\n\n"
+                    f"Found {count} audio file(s):\n{file_list}\n\n"
+                    f"✅ Processing started!\n\n"
+                    f"_You'll receive notifications as each file is processed._",
+                    parse_mode='Markdown'
+                )
+            elif status == 'already_processing':
+                await status_msg.edit_text(
+                    f"📂 *Google Drive Inbox*\n\n"
+                    f"Found {count} audio file(s):\n{file_list}\n\n"
+                    f"⏳ Processing already in progress.\n"
+                    f"_Files will be processed in queue._",
+                    parse_mode='Markdown'
+                )
             else:
                 await status_msg.edit_text(
-                    f"❌ Failed to start processing: HTTP {process_response.status_code}"
+                    f"📂 *Google Drive Inbox*\n\n"
+                    f"Found {count} file(s):\n{file_list}\n\n"
+                    f"Status: {status}",
+                    parse_mode='Markdown'
                 )
-                
+        else:
+            await status_msg.edit_text(
+                f"❌ Failed to start processing: HTTP {process_response.status_code}"
+            )
+            
     except httpx.TimeoutException:
         await status_msg.edit_text("⏱️ Timeout checking audio pipeline. Try again later.")
     except Exception as e:
@@ -472,7 +830,7 @@ async def _get_inventory_summary(client: httpx.AsyncClient, auth_headers: dict)
             headers=auth_headers
         )
         if inv_response.status_code == 200:
-            inv_data = inv_response.json()
+            inv_data = orjson.loads(inv_response.content)
             table_rows = inv_data.get('table', [])
             
             lines = ["\n📊 Database Inventory:"]
@@ -533,172 +891,171 @@ async def sync_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     try:
         auth_headers = get_auth_headers(SYNC_SERVICE_URL)
         
-        # Use a long timeout - full sync can take 2-3 minutes
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            # Call /sync/all endpoint
-            response = await client.post(
-                f"{SYNC_SERVICE_URL}/sync/all",
-                headers=auth_headers
-            )
-            
-            if response.status_code != 200:
-                error_detail = response.text[:200] if response.text else "Unknown error"
-                await status_msg.edit_text(f"❌ Sync failed: HTTP {response.status_code}\n{error_detail}")
-                return
-            
-            result = response.json()
-            status = result.get('status', 'unknown')
+        # Call /sync/all endpoint (long timeout - full sync can take 2-3 minutes)
+        response = await http_client.post(
+            f"{SYNC_SERVICE_URL}/sync/all",
+            headers=auth_headers,
+            timeout=SYNC_TIMEOUT
+        )
+        
+        if response.status_code != 200:
+            error_detail = response.text[:200] if response.text else "Unknown error"
+            await status_msg.edit_text(f"❌ Sync failed: HTTP {response.status_code}\n{error_detail}")
+            return
+        
+        result = orjson.loads(response.content)
+        status = result.get('status', 'unknown')
+        
+        if status == 'skipped':
+            reason = result.get('reason', 'unknown')
+            last_start = result.get('last_sync_start', '')
             
-            if status == 'skipped':
-                reason = result.get('reason', 'unknown')
-                last_start = result.get('last_sync_start', '')
+            # If skipped because already running, wait for it to complete
+            if reason == 'sync_already_in_progress':
+                await status_msg.edit_text("⏳ Sync already in progress, waiting for completion...")
+                
+                # Poll health endpoint until sync completes (max 5 minutes)
+                max_wait = 300  # seconds
+                poll_interval = 10  # seconds
+                elapsed = 0
                 
-                # If skipped because already running, wait for it to complete
-                if reason == 'sync_already_in_progress':
-                    await status_msg.edit_text("⏳ Sync already in progress, waiting for completion...")
+                while elapsed < max_wait:
+                    await asyncio.sleep(poll_interval)
+                    elapsed += poll_interval
                     
-                    # Poll health endpoint until sync completes (max 5 minutes)
-                    max_wait = 300  # seconds
-                    poll_interval = 10  # seconds
-                    elapsed = 0
+                    try:
+                        health_resp = await http_client.get(
+                            f"{SYNC_SERVICE_URL}/health",
+                            headers=auth_headers
+                        )
+                        if health_resp.status_code == 200:
+                            health = orjson.loads(health_resp.content)
+                            sync_info = health.get('sync', {})
+                            
+                            if not sync_info.get('sync_in_progress'):
+                                # Sync completed! Get the inventory
+                                duration = sync_info.get('last_sync_duration_seconds', 0)
+                                inventory_text = await _get_inventory_summary(http_client, auth_headers)
+                                await status_msg.edit_text(
+                                    f"✅ Sync Complete!\n\n"
+                                    f"⏱️ Duration: {duration:.1f}s"
+                                    f"{inventory_text}"
+                                )
+                                return
+                            else:
+                                # Still running, update message
+                                await status_msg.edit_text(f"⏳ Sync in progress... ({elapsed}s elapsed)")
+                    except Exception as poll_error:
+                        logger.warning(f"Polling error: {poll_error}")
+                
+                # Timeout waiting
+                await status_msg.edit_text(
+                    "⏱️ Sync is still running\n\n"
+                    "It's taking longer than expected.\n"
+                    "Check back in a few minutes."
+                )
+                return
+            else:
+                await status_msg.edit_text(
+                    f"⏳ Sync Skipped\n\n"
+                    f"Reason: {reason}\n"
+                    f"Last sync started: {last_start}\n\n"
+                    f"Try again in a minute."
+                )
+                return
+        
+        # Parse results
+        summary = result.get('summary', {})
+        success_count = summary.get('success_count', 0)
+        error_count = summary.get('error_count', 0)
+        duration = summary.get('duration_seconds', 0)
+        results = result.get('results', {})
+        
+        # Build detailed report (without markdown that could fail)
+        report_lines = ["✅ Sync Complete\n"]
+        report_lines.append(f"⏱️ Duration: {duration:.1f}s")
+        report_lines.append(f"✅ Success: {success_count} | ❌ Errors: {error_count}\n")
+        
+        # Categorize syncs
+        sync_categories = {
+            "📇 Contacts": ["notion_to_supabase", "google_sync", "supabase_to_notion"],
+            "📅 Calendar & Email": ["calendar_sync", "gmail_sync"],
+            "📝 Knowledge": ["meetings_sync", "tasks_sync", "reflections_sync", "journals_sync"],
+            "📚 Reading": ["books_sync", "highlights_sync"],
+            "💬 Messaging": ["beeper_sync"]
+        }
+        
+        for category_name, sync_keys in sync_categories.items():
+            category_results = []
+            for key in sync_keys:
+                if key in results:
+                    r = results[key]
+                    status_icon = "✅" if r.get('status') == 'success' else "❌"
+                    # Get sync stats if available
+                    data = r.get('data', {})
+                    display_name = key.replace('_sync', '').replace('_', ' ').title()
                     
-                    while elapsed < max_wait:
-                        await asyncio.sleep(poll_interval)
-                        elapsed += poll_interval
+                    if isinstance(data, dict):
+                        # Try multiple possible field names for created/updated counts
+                        created = (
+                            data.get('created', 0) or 
+                            data.get('events_created', 0) or 
+                            data.get('new_contacts', 0) or
+                            data.get('notion_created', 0) or
+                            data.get('supabase_created', 0) or
+                            0
+                        )
+                        updated = (
+                            data.get('updated', 0) or 
+                            data.get('events_updated', 0) or 
+                            data.get('updated_contacts', 0) or
+                            data.get('notion_updated', 0) or
+                            data.get('supabase_updated', 0) or
+                            0
+                        )
+                        deleted = data.get('deleted', 0) or data.get('notion_deleted', 0) or 0
                         
-                        try:
-                            health_resp = await client.get(
-                                f"{SYNC_SERVICE_URL}/health",
-                                headers=auth_headers
-                            )
-                            if health_resp.status_code == 200:
-                                health = health_resp.json()
-                                sync_info = health.get('sync', {})
-                                
-                                if not sync_info.get('sync_in_progress'):
-                                    # Sync completed! Get the inventory
-                                    duration = sync_info.get('last_sync_duration_seconds', 0)
-                                    inventory_text = await _get_inventory_summary(client, auth_headers)
-                                    await status_msg.edit_text(
-                                        f"✅ Sync Complete!\n\n"
-                                        f"⏱️ Duration: {duration:.1f}s"
-                                        f"{inventory_text}"
-                                    )
-                                    return
-                                else:
-                                    # Still running, update message
-                                    await status_msg.edit_text(f"⏳ Sync in progress... ({elapsed}s elapsed)")
-                        except Exception as poll_error:
-                            logger.warning(f"Polling error: {poll_error}")
-                    
-                    # Timeout waiting
-                    await status_msg.edit_text(
-                        "⏱️ Sync is still running\n\n"
-                        "It's taking longer than expected.\n"
-                        "Check back in a few minutes."
-                    )
-                    return
-                else:
-                    await status_msg.edit_text(
-                        f"⏳ Sync Skipped\n\n"
-                        f"Reason: {reason}\n"
-                        f"Last sync started: {last_start}\n\n"
-                        f"Try again in a minute."
-                    )
-                    return
-            
-            # Parse results
-            summary = result.get('summary', {})
-            success_count = summary.get('success_count', 0)
-            error_count = summary.get('error_count', 0)
-            duration = summary.get('duration_seconds', 0)
-            results = result.get('results', {})
-            
-            # Build detailed report (without markdown that could fail)
-            report_lines = ["✅ Sync Complete\n"]
-            report_lines.append(f"⏱️ Duration: {duration:.1f}s")
-            report_lines.append(f"✅ Success: {success_count} | ❌ Errors: {error_count}\n")
-            
-            # Categorize syncs
-            sync_categories = {
-                "📇 Contacts": ["notion_to_supabase", "google_sync", "supabase_to_notion"],
-                "📅 Calendar & Email": ["calendar_sync", "gmail_sync"],
-                "📝 Knowledge": ["meetings_sync", "tasks_sync", "reflections_sync", "journals_sync"],
-                "📚 Reading": ["books_sync", "highlights_sync"],
-                "💬 Messaging": ["beeper_sync"]
-            }
-            
-            for category_name, sync_keys in sync_categories.items():
-                category_results = []
-                for key in sync_keys:
-                    if key in results:
-                        r = results[key]
-                        status_icon = "✅" if r.get('status') == 'success' else "❌"
-                        # Get sync stats if available
-                        data = r.get('data', {})
-                        display_name = key.replace('_sync', '').replace('_', ' ').title()
+                        # Build stats string
+                        stats_parts = []
+                        if created:
+                            stats_parts.append(f"+{created}")
+                        if updated:
+                            stats_parts.append(f"~{updated}")
+                        if deleted:
+                            stats_parts.append(f"-{deleted}")
                         
-                        if isinstance(data, dict):
-                            # Try multiple possible field names for created/updated counts
-                            created = (
-                                data.get('created', 0) or 
-                                data.get('events_created', 0) or 
-                                data.get('new_contacts', 0) or
-                                data.get('notion_created', 0) or
-                                data.get('supabase_created', 0) or
-                                0
-                            )
-                            updated = (
-                                data.get('updated', 0) or 
-                                data.get('events_updated', 0) or 
-                                data.get('updated_contacts', 0) or
-                                data.get('notion_updated', 0) or
-                                data.get('supabase_updated', 0) or
-                                0
-                            )
-                            deleted = data.get('deleted', 0) or data.get('notion_deleted', 0) or 0
-                            
-                            # Build stats string
-                            stats_parts = []
-                            if created:
-                                stats_parts.append(f"+{created}")
-                            if updated:
-                                stats_parts.append(f"~{updated}")
-                            if deleted:
-                                stats_parts.append(f"-{deleted}")
-                            
-                            if stats_parts:
-                                category_results.append(f"  {status_icon} {display_name}: {' / '.join(stats_parts)}")
-                            else:
-                                category_results.append(f"  {status_icon} {display_name}")
-                        elif r.get('status') == 'error':
-                            # Sanitize error message - remove special chars that break markdown
-                            err = str(r.get('error', 'Unknown'))[:40]
-                            err = err.replace('*', '').replace('_', '').replace('`', '').replace('[', '').replace(']', '')
-                            category_results.append(f"  {status_icon} {display_name}: {err}")
+                        if stats_parts:
+                            category_results.append(f"  {status_icon} {display_name}: {' / '.join(stats_parts)}")
                         else:
                             category_results.append(f"  {status_icon} {display_name}")
-                
-                if category_results:
-                    report_lines.append(category_name)
-                    report_lines.extend(category_results)
-                    report_lines.append("")  # Empty line between categories
-            
-            # Get inventory summary
-            inventory_text = await _get_inventory_summary(client, auth_headers)
-            if inventory_text:
-                report_lines.append(inventory_text)
-            
-            # Join and send report (no markdown to avoid parsing issues)
-            report = "\n".join(report_lines)
-            
-            # Telegram message limit is 4096 chars
-            if len(report) > 4000:
-                report = report[:3950] + "\n\n...truncated"
-            
-            # Send without markdown to avoid parsing errors
-            await status_msg.edit_text(report)
+                    elif r.get('status') == 'error':
+                        # Sanitize error message - remove special chars that break markdown
+                        err = str(r.get('error', 'Unknown'))[:40]
+                        err = err.replace('*', '').replace('_', '').replace('`', '').replace('[', '').replace(']', '')
+                        category_results.append(f"  {status_icon} {display_name}: {err}")
+                    else:
+                        category_results.append(f"  {status_icon} {display_name}")
             
+            if category_results:
+                report_lines.append(category_name)
+                report_lines.extend(category_results)
+                report_lines.append("")  # Empty line between categories
+        
+        # Get inventory summary
+        inventory_text = await _get_inventory_summary(http_client, auth_headers)
+        if inventory_text:
+            report_lines.append(inventory_text)
+        
+        # Join and send report (no markdown to avoid parsing issues)
+        report = "\n".join(report_lines)
+        
+        # Telegram message limit is 4096 chars
+        if len(report) > 4000:
+            report = report[:3950] + "\n\n...truncated"
+        
+        # Send without markdown to avoid parsing errors
+        await status_msg.edit_text(report)
+        
     except httpx.TimeoutException:
         await status_msg.edit_text(
             "⏱️ Sync Timeout\n\n"
@@ -718,16 +1075,96 @@ def is_authorized(user_id: int) -> bool:
     return user_id in ALLOWED_USER_IDS
 
 
+# Unauthorized users get the rejection at most once per window - repeated updates
+# from strangers are dropped in webhook() before an Update is even built
+UNAUTHORIZED_REPLY_WINDOW = 5 * 60  # seconds
+UNAUTHORIZED_REPLY_MAX_USERS = 1024
+_unauthorized_replied = OrderedDict()  # { user_id: replied_at }
+
+
+# Without an Intelligence Service, plain texts only get the help nudge - send it at
+# most once per window so a burst of texts doesn't spend the bot's send budget
+HELP_REPLY_WINDOW = 5 * 60  # seconds
+HELP_REPLY_MAX_USERS = 1024
+_help_replied = OrderedDict()  # { user_id: replied_at }
+
+
+def _reply_due(replied: OrderedDict, user_id: int, window: float, max_users: int) -> bool:
+    """True (and record it) if user_id hasn't had this reply within window seconds."""
+    now = time.monotonic()
+    replied_at = replied.get(user_id)
+    if replied_at and now - replied_at < window:
+        return False
+    replied[user_id] = now
+    replied.move_to_end(user_id)
+    while len(replied) > max_users:
+        replied.popitem(last=False)
+    return True
+
+
+def _should_reply_unauthorized(user_id: int) -> bool:
+    """True if this unauthorized user hasn't been told so within the window."""
+    return _reply_due(_unauthorized_replied, user_id, UNAUTHORIZED_REPLY_WINDOW, UNAUTHORIZED_REPLY_MAX_USERS)
+
+
+def _should_send_help(user_id: int) -> bool:
+    """True if this user hasn't had the plain-text help nudge within the window."""
+    return _reply_due(_help_replied, user_id, HELP_REPLY_WINDOW, HELP_REPLY_MAX_USERS)
+
+
 # =========================================================================
 # BACKGROUND AUDIO PROCESSING (Non-blocking for long audio files)
 # =========================================================================
 
+class TokenBucket:
+    """Async token bucket: allows `burst` calls at once, refilling at `rate` per second."""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Smooths bursts of pipeline POSTs (retries included) on top of _audio_semaphore
+_pipeline_rate_limiter = TokenBucket(
+    rate=float(os.getenv('PIPELINE_RATE_PER_SEC', '5')),
+    burst=int(os.getenv('PIPELINE_RATE_BURST', '10'))
+)
+
+# Pipeline answers worth retrying: rate limited, or the service/front end is unavailable.
+# 500/504 are left out - the pipeline may already have created records for the upload.
+PIPELINE_RETRY_STATUS_CODES = frozenset({429, 502, 503})
+
+
+def _pipeline_retry_delay(response: httpx.Response | None, backoff: float) -> float:
+    """Seconds to wait before retrying: the server's Retry-After if given, else jittered backoff."""
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    if retry_after.isdigit():
+        return min(float(retry_after), 300.0)
+    return backoff * random.uniform(0.5, 1.5)
+
+
 async def process_audio_in_background(
     bot,
     chat_id: int,
     user_id: int,
     username: str,
-    file_bytes: bytes,
+    audio_file: BinaryIO | None,
+    file_id: str,
     filename: str,
     mimetype: str,
     file_unique_id: str,
@@ -742,6 +1179,11 @@ async def process_audio_in_background(
     
     This allows users to continue chatting while audio files are being
     transcribed and analyzed (even for 2+ hour recordings).
+    
+    Takes ownership of audio_file (a spooled download) and closes it when done;
+    it is streamed into the upload rather than copied into memory. With
+    audio_file=None the pipeline is handed the Telegram URL for file_id instead,
+    falling back to downloading and uploading if it doesn't support that.
     """
     queue_position = 0
     
@@ -761,8 +1203,10 @@ async def process_audio_in_background(
                 )
         
         # Acquire semaphore (wait if at capacity)
+        queued_at = time.monotonic()
         async with _audio_semaphore:
-            logger.info(f"Background processing started for {filename} ({len(file_bytes)} bytes)")
+            waited = time.monotonic() - queued_at
+            logger.info(f"Background processing started for {filename} (waited {waited:.1f}s for a slot)")
             
             # Track this processing
             async with _processing_lock:
@@ -788,52 +1232,72 @@ async def process_audio_in_background(
                 auth_headers["Authorization"] = f"Bearer {identity_token}"
             
             # Use a very long timeout for big files (2 hours of audio = ~30 min processing)
-            # Retry logic for 503 errors (service temporarily unavailable)
-            max_retries = 3
-            retry_delay = 30  # seconds
+            # Retry with exponential backoff + jitter on 429/502/503 and connection failures
+            max_retries = 4
+            retry_delay = 15  # seconds
             
             for attempt in range(max_retries):
                 try:
-                    async with httpx.AsyncClient(timeout=3600.0) as client:
-                        files = {'file': (filename, file_bytes, mimetype)}
+                    await _pipeline_rate_limiter.acquire()
+                    
+                    if audio_file is None:
+                        # Fetched fresh (cached < 1h) - a queued file's download link may have expired
+                        file = await get_file_cached(bot, file_id)
+                        response = await http_client.post(
+                            f"{AUDIO_PIPELINE_URL}/process/url",
+                            json={'file_url': file.file_path, 'filename': filename, 'username': username},
+                            headers=auth_headers,
+                            timeout=PIPELINE_UPLOAD_TIMEOUT
+                        )
+                        if response.status_code in (404, 501):
+                            # Pipeline can't fetch URLs - send the bytes ourselves
+                            logger.warning(f"Pipeline has no /process/url ({response.status_code}), uploading {filename}")
+                            audio_file = await download_to_spool(file)
+                    
+                    if audio_file is not None:
+                        audio_file.seek(0)  # Rewind for each attempt
+                        files = {'file': (filename, audio_file, mimetype)}
                         data = {'username': username}
                         
-                        response = await client.post(
+                        response = await http_client.post(
                             f"{AUDIO_PIPELINE_URL}/process/upload",
                             files=files,
                             data=data,
-                            headers=auth_headers
+                            headers=auth_headers,
+                            timeout=PIPELINE_UPLOAD_TIMEOUT
                         )
-                        
-                        # Handle 503 Service Unavailable - pipeline might be overloaded or restarting
-                        if response.status_code == 503:
-                            if attempt < max_retries - 1:
-                                logger.warning(f"Pipeline returned 503, retrying in {retry_delay}s (attempt {attempt + 1}/{max_retries})")
-                                await bot.send_message(
-                                    chat_id=chat_id,
-                                    text=f"⏳ Pipeline busy, retrying `{filename}` in {retry_delay}s...",
-                                    parse_mode='Markdown'
-                                )
-                                await asyncio.sleep(retry_delay)
-                                retry_delay *= 2  # Exponential backoff
-                                continue
-                            else:
-                                # Final attempt failed
-                                raise Exception(f"Pipeline unavailable after {max_retries} attempts")
-                        
-                        # Success or other error - break out of retry loop
-                        break
-                        
-                except httpx.TimeoutException:
+                    
+                    # Pipeline might be rate limiting, overloaded or restarting
+                    if response.status_code in PIPELINE_RETRY_STATUS_CODES:
+                        if attempt < max_retries - 1:
+                            delay = _pipeline_retry_delay(response, retry_delay)
+                            logger.warning(f"Pipeline returned {response.status_code}, retrying in {delay:.0f}s (attempt {attempt + 1}/{max_retries})")
+                            await bot.send_message(
+                                chat_id=chat_id,
+                                text=f"⏳ Pipeline busy, retrying `{filename}` in {delay:.0f}s...",
+                                parse_mode='Markdown'
+                            )
+                            await asyncio.sleep(delay)
+                            retry_delay *= 2  # Exponential backoff
+                            continue
+                        else:
+                            # Final attempt failed
+                            raise Exception(f"Pipeline unavailable after {max_retries} attempts")
+                    
+                    # Success or other error - break out of retry loop
+                    break
+                    
+                except (httpx.TimeoutException, httpx.ConnectError) as e:
                     if attempt < max_retries - 1:
-                        logger.warning(f"Pipeline timeout, retrying (attempt {attempt + 1}/{max_retries})")
-                        await asyncio.sleep(retry_delay)
+                        delay = _pipeline_retry_delay(None, retry_delay)
+                        logger.warning(f"Pipeline {type(e).__name__}, retrying in {delay:.0f}s (attempt {attempt + 1}/{max_retries})")
+                        await asyncio.sleep(delay)
                         retry_delay *= 2
                         continue
                     raise
             
             if response.status_code == 200:
-                result = response.json()
+                result = orjson.loads(response.content)
                 
                 if result.get("status") == "success":
                     summary = result.get("summary", "Processed successfully")
@@ -858,12 +1322,12 @@ async def process_audio_in_background(
                     voice_memo_context = _build_voice_memo_history_entry(
                         details, summary, result.get("category")
                     )
-                    _add_to_conversation_history(
+                    await _add_to_conversation_history(
                         user_id,
                         "user",
                         f"[Audio File Processed]\n{voice_memo_context['user_context']}"
                     )
-                    _add_to_conversation_history(
+                    await _add_to_conversation_history(
                         user_id,
                         "assistant",
                         voice_memo_context['assistant_summary']
@@ -913,122 +1377,159 @@ async def process_audio_in_background(
         # Clean up tracking
         async with _processing_lock:
             background_processing.pop(file_unique_id, None)
+        if audio_file is not None:
+            audio_file.close()
 
-async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    Handle incoming voice messages.
+    Handle incoming voice messages and audio files (mp3, m4a, etc).
     
     ALL audio processing happens in the background to avoid blocking the webhook.
     Telegram expects webhook responses within 60 seconds, but audio transcription
     can take 30-300+ seconds depending on length.
     
     Note: Telegram Bot API has a 20MB download limit. Voice messages rarely exceed
-    this (would need to be ~2+ hours), but if they do, we provide guidance.
+    this (would need to be ~2+ hours); for larger audio files, users should upload
+    directly to Google Drive.
     """
     user = update.effective_user
+    message = update.message
+    is_voice = message.voice is not None
+    media = message.voice or message.audio
+    kind = "voice message" if is_voice else "audio file"
     
     # Check authorization
     if not is_authorized(user.id):
-        await update.message.reply_text("❌ You are not authorized to use this bot.")
+        await message.reply_text("❌ You are not authorized to use this bot.")
         logger.warning(f"Unauthorized access attempt by user {user.id} ({user.username})")
         return
     
-    voice = update.message.voice
-    
     # Check for duplicate processing (Telegram sometimes resends)
-    if _is_duplicate_file(voice.file_unique_id):
-        logger.warning(f"Duplicate voice message detected, skipping: {voice.file_unique_id}")
+    if _is_duplicate_file(media.file_unique_id):
+        logger.warning(f"Duplicate {kind} detected, skipping: {media.file_unique_id}")
         return
     
-    # Clear any pending contact linking - new voice message takes priority
+    # Clear any pending contact linking - new audio takes priority
     if _clear_pending_contacts(user.id):
-        logger.info(f"Cleared pending contact linking for user {user.id} (new voice message)")
+        logger.info(f"Cleared pending contact linking for user {user.id} (new {kind})")
     
-    file_size = voice.file_size or 0
-    duration = voice.duration or 0
+    file_size = media.file_size or 0
+    duration = media.duration or 0
     
-    logger.info(f"Received voice message from {user.username} ({user.id}), size: {file_size} bytes, duration: {duration}s")
+    logger.info(f"Received {kind} from {user.username} ({user.id}), size: {file_size} bytes, duration: {duration}s")
     
     # Check Telegram's 20MB bot download limit
     TELEGRAM_FILE_LIMIT = 20 * 1024 * 1024  # 20MB
     if file_size > TELEGRAM_FILE_LIMIT:
-        await update.message.reply_text(
-            f"⚠️ *File too large for Telegram Bot API*\n\n"
-            f"Your voice memo is {file_size / 1024 / 1024:.1f} MB, but Telegram limits "
-            f"bot downloads to 20 MB.\n\n"
-            f"*Alternatives:*\n"
-            f"1️⃣ Upload directly to Google Drive's 'Audio Files' folder\n"
-            f"2️⃣ Split into smaller recordings (< 20 min each)\n"
-            f"3️⃣ Send as a regular audio file (same limit applies)\n\n"
-            f"Files in Google Drive are auto-processed every 15 minutes.",
-            parse_mode='Markdown'
-        )
-        logger.warning(f"Voice file too large: {file_size} bytes > 20MB limit")
+        if is_voice:
+            await message.reply_text(
+                f"⚠️ *File too large for Telegram Bot API*\n\n"
+                f"Your voice memo is {file_size / 1024 / 1024:.1f} MB, but Telegram limits "
+                f"bot downloads to 20 MB.\n\n"
+                f"*Alternatives:*\n"
+                f"1️⃣ Upload directly to Google Drive's 'Audio Files' folder\n"
+                f"2️⃣ Split into smaller recordings (< 20 min each)\n"
+                f"3️⃣ Send as a regular audio file (same limit applies)\n\n"
+                f"Files in Google Drive are auto-processed every 15 minutes.",
+                parse_mode='Markdown'
+            )
+        else:
+            duration_str = f"{duration // 60}m {duration % 60}s" if duration else "unknown"
+            await message.reply_text(
+                f"⚠️ *File too large for Telegram Bot API*\n\n"
+                f"📁 Size: {file_size / 1024 / 1024:.1f} MB (limit: 20 MB)\n"
+                f"⏱️ Duration: {duration_str}\n\n"
+                f"Telegram bots cannot download files larger than 20 MB.\n\n"
+                f"*How to process this file:*\n"
+                f"1️⃣ Upload to Google Drive's *'Audio Files'* folder\n"
+                f"   → It will be processed automatically within 15 min\n\n"
+                f"2️⃣ Or split into smaller parts (< 20 min each)\n\n"
+                f"_This is a Telegram platform limitation, not Jarvis._",
+                parse_mode='Markdown'
+            )
+        logger.warning(f"{kind.capitalize()} too large: {file_size} bytes > 20MB limit")
         return
     
-    # Always acknowledge immediately - don't block webhook
-    if duration > 60:  # > 1 minute
-        status_msg = await update.message.reply_text(
-            f"🎤 Voice memo received ({duration // 60}m {duration % 60}s)\n\n"
-            "⏳ Processing in background - you can continue chatting.\n"
-            "I'll notify you when it's done.",
-            parse_mode='Markdown'
-        )
+    # Generate filename
+    timestamp = time.strftime('%Y%m%d_%H%M%S')
+    if is_voice:
+        mimetype = 'audio/ogg'
+        filename = f"voice_{timestamp}_{user.username or user.id}.ogg"
     else:
-        status_msg = await update.message.reply_text(
-            "🎤 Voice memo received\n⏳ Processing..."
-        )
+        ext = media.mime_type.split('/')[-1] if media.mime_type else 'mp3'
+        mimetype = media.mime_type or 'audio/mpeg'
+        filename = f"audio_{timestamp}_{user.username or user.id}.{ext}"
     
+    # Drive fallback: album items are uploaded together once the whole group has arrived
+    # (only audio files can be grouped - Telegram never sends voice notes as albums)
+    if not AUDIO_PIPELINE_URL and message.media_group_id:
+        await add_to_media_group(update, context, media, media.file_name or filename, mimetype)
+        return
+    
+    # Resolve the download URL while the acknowledgement is on its way
+    file_task = asyncio.create_task(get_file_cached(context.bot, media.file_id))
+    
+    status_msg = None
+    file_bytes = None
     try:
-        # Download voice file
-        file = await context.bot.get_file(voice.file_id)
-        file_bytes = io.BytesIO()
-        await file.download_to_memory(file_bytes)
-        file_bytes.seek(0)
+        # Always acknowledge immediately - don't block webhook
+        if is_voice and duration > 60:  # > 1 minute
+            status_msg = await message.reply_text(
+                f"🎤 Voice memo received ({duration // 60}m {duration % 60}s)\n\n"
+                "⏳ Processing in background - you can continue chatting.\n"
+                "I'll notify you when it's done.",
+                parse_mode='Markdown'
+            )
+        elif is_voice:
+            status_msg = await message.reply_text(
+                "🎤 Voice memo received\n⏳ Processing..."
+            )
+        elif duration > 60 or file_size > 5 * 1024 * 1024:  # > 1 minute or > 5MB
+            status_msg = await message.reply_text(
+                f"🎵 Audio file received ({file_size / 1024 / 1024:.1f} MB)\n\n"
+                "⏳ Processing in background - you can continue chatting.\n"
+                "I'll notify you when it's done.",
+                parse_mode='Markdown'
+            )
+        else:
+            status_msg = await message.reply_text(
+                "🎵 Audio file received\n⏳ Processing..."
+            )
         
-        # Generate filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"voice_{timestamp}_{user.username or user.id}.ogg"
+        file = await file_task
         
         if AUDIO_PIPELINE_URL:
-            # Start background task - don't block webhook
-            asyncio.create_task(
+            # Start background task - don't block webhook.
+            # The task owns the spooled download and closes it when finished.
+            audio_task = asyncio.create_task(
                 process_audio_in_background(
                     bot=context.bot,
                     chat_id=update.effective_chat.id,
                     user_id=user.id,
                     username=user.username or str(user.id),
-                    file_bytes=file_bytes.getvalue(),
+                    audio_file=None if PIPELINE_FETCHES_AUDIO else await download_to_spool(file),
+                    file_id=media.file_id,
                     filename=filename,
-                    mimetype='audio/ogg',
-                    file_unique_id=voice.file_unique_id
+                    mimetype=mimetype,
+                    file_unique_id=media.file_unique_id
                 )
             )
+            _audio_tasks.add(audio_task)
+            audio_task.add_done_callback(_audio_tasks.discard)
             logger.info(f"Started background processing for {filename}")
             return  # Return immediately to Telegram
         
         # Fallback: Upload to Google Drive if no pipeline URL
         await status_msg.edit_text("☁️ Uploading to Google Drive...")
-        file_bytes.seek(0)
         
-        drive_service = get_drive_service()
-        
-        file_metadata = {
-            'name': filename,
-            'parents': [GOOGLE_DRIVE_FOLDER_ID]
-        }
-        
-        media = MediaIoBaseUpload(
-            file_bytes,
-            mimetype='audio/ogg',
-            resumable=True
-        )
-        
-        uploaded_file = drive_service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id,name'
-        ).execute()
+        if file_size >= DRIVE_RESUMABLE_THRESHOLD:
+            # Large file - stream Telegram -> Drive chunk by chunk
+            uploaded_file = await stream_to_drive(file, filename, mimetype)
+        else:
+            file_bytes = await download_to_spool(file)
+            uploaded_file = await asyncio.to_thread(
+                upload_to_drive, file_bytes, filename, mimetype
+            )
         
         logger.info(f"Uploaded to Drive: {uploaded_file['name']}")
         
@@ -1040,136 +1541,104 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
         
     except Exception as e:
-        logger.error(f"Error processing voice message: {e}", exc_info=True)
-        await status_msg.edit_text(f"❌ Error: {str(e)}")
+        logger.error(f"Error processing {kind}: {e}", exc_info=True)
+        if status_msg:
+            await status_msg.edit_text(f"❌ Error: {str(e)}")
+    finally:
+        # The acknowledgement failed before the lookup was awaited - don't orphan it
+        if not file_task.done():
+            file_task.cancel()
+        if file_bytes is not None:
+            file_bytes.close()
 
 
-async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """
-    Handle incoming audio files (mp3, m4a, etc).
-    
-    ALL audio processing happens in the background to avoid blocking the webhook.
-    
-    Note: Telegram Bot API has a 20MB download limit. For larger files,
-    users should upload directly to Google Drive.
-    """
-    user = update.effective_user
-    
-    if not is_authorized(user.id):
-        await update.message.reply_text("❌ You are not authorized to use this bot.")
-        return
+# =========================================================================
+# MEDIA GROUPS - albums of audio files are uploaded to Drive as one batch
+# =========================================================================
+
+# Mirrored in main.py: the polling and webhook entry points are deployed and run
+# independently, so each carries its own copy of the Drive helpers - keep them in sync.
+
+# Telegram delivers each album item as its own update; wait this long after
+# the last item before uploading the whole group
+MEDIA_GROUP_WINDOW = 1.5  # seconds
+
+# Format: { media_group_id: {"items": [(file_obj, filename, mimetype)], "status_msg": Message,
+#                            "downloading": int, "errors": [str], "flush_task": Task} }
+_pending_media_groups = {}
+
+
+async def add_to_media_group(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                             media, filename: str, mimetype: str) -> None:
+    """Download one album item and queue it; the group is flushed once it stops growing."""
+    group_id = update.message.media_group_id
     
-    audio = update.message.audio
+    group = _pending_media_groups.get(group_id)
+    if group is None:
+        # Register before awaiting so concurrent album items join this group
+        group = {'items': [], 'status_msg': None, 'downloading': 0, 'errors': [], 'flush_task': None}
+        _pending_media_groups[group_id] = group
+        try:
+            group['status_msg'] = await update.message.reply_text("🎵 Receiving audio files...")
+        except Exception as e:
+            # Keep the group - the files still get uploaded, just without a progress message
+            logger.error(f"Error acknowledging album {group_id}: {e}", exc_info=True)
     
-    # Check for duplicate processing
-    if _is_duplicate_file(audio.file_unique_id):
-        logger.warning(f"Duplicate audio file detected, skipping: {audio.file_unique_id}")
-        return
+    group['downloading'] += 1
+    try:
+        file = await get_file_cached(context.bot, media.file_id)
+        group['items'].append((await download_to_spool(file), filename, mimetype))
+    except Exception as e:
+        logger.error(f"Error downloading album item {filename}: {e}", exc_info=True)
+        group['errors'].append(f"{filename}: {e}")
+    finally:
+        group['downloading'] -= 1
     
-    # Clear any pending contact linking - new audio message takes priority
-    if _clear_pending_contacts(user.id):
-        logger.info(f"Cleared pending contact linking for user {user.id} (new audio message)")
+    # (Re)start the quiet-period timer
+    if group['flush_task']:
+        group['flush_task'].cancel()
+    group['flush_task'] = asyncio.create_task(_flush_media_group_later(group_id))
+
+
+async def _flush_media_group_later(group_id: str) -> None:
+    """Flush a media group once no new items arrived for MEDIA_GROUP_WINDOW seconds."""
+    await asyncio.sleep(MEDIA_GROUP_WINDOW)
     
-    file_size = audio.file_size or 0
-    duration = audio.duration or 0
+    group = _pending_media_groups.get(group_id)
+    if not group or group['downloading']:
+        return  # The last download to finish reschedules the flush
+    _pending_media_groups.pop(group_id, None)
     
-    logger.info(f"Received audio file from {user.username} ({user.id}), size: {file_size} bytes, duration: {duration}s")
+    items = group['items']
+    results = await asyncio.gather(
+        *(asyncio.to_thread(upload_to_drive, file_obj, filename, mimetype)
+          for file_obj, filename, mimetype in items),
+        return_exceptions=True
+    )
     
-    # Check Telegram's 20MB bot download limit
-    TELEGRAM_FILE_LIMIT = 20 * 1024 * 1024  # 20MB
-    if file_size > TELEGRAM_FILE_LIMIT:
-        duration_str = f"{duration // 60}m {duration % 60}s" if duration else "unknown"
-        await update.message.reply_text(
-            f"⚠️ *File too large for Telegram Bot API*\n\n"
-            f"📁 Size: {file_size / 1024 / 1024:.1f} MB (limit: 20 MB)\n"
-            f"⏱️ Duration: {duration_str}\n\n"
-            f"Telegram bots cannot download files larger than 20 MB.\n\n"
-            f"*How to process this file:*\n"
-            f"1️⃣ Upload to Google Drive's *'Audio Files'* folder\n"
-            f"   → It will be processed automatically within 15 min\n\n"
-            f"2️⃣ Or split into smaller parts (< 20 min each)\n\n"
-            f"_This is a Telegram platform limitation, not Jarvis._",
-            parse_mode='Markdown'
-        )
-        logger.warning(f"Audio file too large: {file_size} bytes > 20MB limit")
+    lines = []
+    uploaded = 0
+    for (file_obj, filename, _), result in zip(items, results):
+        file_obj.close()
+        if isinstance(result, Exception):
+            logger.error(f"Error uploading album item {filename}: {result}")
+            lines.append(f"❌ {filename}: {result}")
+        else:
+            logger.info(f"Uploaded to Drive: {result['name']}")
+            uploaded += 1
+            lines.append(f"📁 {filename}")
+    lines.extend(f"❌ {error}" for error in group['errors'])
+    
+    total = len(items) + len(group['errors'])
+    if group['status_msg'] is None:
+        logger.info(f"Album {group_id}: uploaded {uploaded}/{total} audio file(s), no status message to update")
         return
-    
-    # Always acknowledge immediately - don't block webhook
-    if duration > 60 or file_size > 5 * 1024 * 1024:  # > 1 minute or > 5MB
-        status_msg = await update.message.reply_text(
-            f"🎵 Audio file received ({file_size / 1024 / 1024:.1f} MB)\n\n"
-            "⏳ Processing in background - you can continue chatting.\n"
-            "I'll notify you when it's done.",
-            parse_mode='Markdown'
-        )
-    else:
-        status_msg = await update.message.reply_text(
-            "🎵 Audio file received\n⏳ Processing..."
-        )
-    
     try:
-        file = await context.bot.get_file(audio.file_id)
-        file_bytes = io.BytesIO()
-        await file.download_to_memory(file_bytes)
-        file_bytes.seek(0)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        ext = audio.mime_type.split('/')[-1] if audio.mime_type else 'mp3'
-        mimetype = audio.mime_type or 'audio/mpeg'
-        filename = f"audio_{timestamp}_{user.username or user.id}.{ext}"
-        
-        if AUDIO_PIPELINE_URL:
-            # Start background task - don't block webhook
-            asyncio.create_task(
-                process_audio_in_background(
-                    bot=context.bot,
-                    chat_id=update.effective_chat.id,
-                    user_id=user.id,
-                    username=user.username or str(user.id),
-                    file_bytes=file_bytes.getvalue(),
-                    filename=filename,
-                    mimetype=mimetype,
-                    file_unique_id=audio.file_unique_id
-                )
-            )
-            logger.info(f"Started background processing for {filename}")
-            return  # Return immediately to Telegram
-        
-        # Fallback: Upload to Google Drive if no pipeline URL
-        await status_msg.edit_text("☁️ Uploading to Google Drive...")
-        file_bytes.seek(0)
-        
-        drive_service = get_drive_service()
-        
-        file_metadata = {
-            'name': filename,
-            'parents': [GOOGLE_DRIVE_FOLDER_ID]
-        }
-        
-        media = MediaIoBaseUpload(
-            file_bytes,
-            mimetype=mimetype,
-            resumable=True
-        )
-        
-        uploaded_file = drive_service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id,name'
-        ).execute()
-        
-        logger.info(f"Uploaded to Drive: {uploaded_file['name']}")
-        
-        await status_msg.edit_text(
-            f"✅ Audio uploaded to Drive\n\n"
-            f"📁 File: `{filename}`\n\n"
-            f"⏳ Will be processed within 15 minutes.",
-            parse_mode='Markdown'
+        await group['status_msg'].edit_text(
+            f"✅ Uploaded {uploaded}/{total} audio file(s) to Drive\n\n" + "\n".join(lines)
         )
-        
     except Exception as e:
-        logger.error(f"Error processing audio file: {e}", exc_info=True)
-        await status_msg.edit_text(f"❌ Error: {str(e)}")
+        logger.error(f"Error reporting album {group_id} upload: {e}", exc_info=True)
 
 
 # =========================================================================
@@ -1193,32 +1662,31 @@ async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     try:
         auth_headers = get_auth_headers(INTELLIGENCE_SERVICE_URL)
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Send location to Intelligence Service
-            response = await client.post(
-                f"{INTELLIGENCE_SERVICE_URL}/api/v1/location",
-                json={
-                    "latitude": location.latitude,
-                    "longitude": location.longitude
-                },
-                headers=auth_headers
+        # Send location to Intelligence Service
+        response = await http_client.post(
+            f"{INTELLIGENCE_SERVICE_URL}/api/v1/location",
+            json={
+                "latitude": location.latitude,
+                "longitude": location.longitude
+            },
+            headers=auth_headers
+        )
+        
+        if response.status_code == 200:
+            result = orjson.loads(response.content)
+            city = result.get("city", "Unknown")
+            tz = result.get("timezone", "UTC")
+            
+            await update.message.reply_text(
+                f"📍 *Location updated!*\n\n"
+                f"🏙️ City: {city}\n"
+                f"🕐 Timezone: {tz}\n\n"
+                f"I'll now use your timezone for scheduling and time-related questions.",
+                parse_mode='Markdown'
             )
+        else:
+            await update.message.reply_text(f"⚠️ Failed to update location: {response.text}")
             
-            if response.status_code == 200:
-                result = response.json()
-                city = result.get("city", "Unknown")
-                tz = result.get("timezone", "UTC")
-                
-                await update.message.reply_text(
-                    f"📍 *Location updated!*\n\n"
-                    f"🏙️ City: {city}\n"
-                    f"🕐 Timezone: {tz}\n\n"
-                    f"I'll now use your timezone for scheduling and time-related questions.",
-                    parse_mode='Markdown'
-                )
-            else:
-                await update.message.reply_text(f"⚠️ Failed to update location: {response.text}")
-                
     except Exception as e:
         logger.error(f"Location update error: {e}")
         await update.message.reply_text(f"❌ Error updating location: {str(e)}")
@@ -1228,6 +1696,32 @@ async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 # CONTACT LINKING HELPERS (Text-based for Beeper/bridge compatibility)
 # =========================================================================
 
+def _iter_contact_matches(contact_matches: list, meeting_ids: list):
+    """Yield (meeting_id, searched_name, match) for each match tied to a meeting."""
+    for i, match in enumerate(contact_matches):
+        meeting_id = match.get('meeting_id') or (meeting_ids[i] if i < len(meeting_ids) else None)
+        if meeting_id:
+            yield meeting_id, match.get('searched_name', 'Unknown'), match
+
+
+# Fixed tails of the contact prompts
+CONTACT_PROMPT_CHOICES_TAIL = "  0 = Skip\n  Or type the correct full name"
+CONTACT_PROMPT_NO_SUGGESTIONS = "Reply with:\n  The correct full name (e.g. 'John Smith')\n  Or '0' to skip"
+
+
+def _format_contact_prompt(title: str, searched_name: str, suggestions: list) -> str:
+    """Prompt for one unmatched contact: numbered suggestions, or ask for the full name."""
+    if not suggestions:
+        return f"{title}: *{searched_name}*\n\n{CONTACT_PROMPT_NO_SUGGESTIONS}"
+    
+    choices = "\n".join(
+        f"  {j} = {s.get('name', 'Unknown')} ({s['company']})" if s.get('company')
+        else f"  {j} = {s.get('name', 'Unknown')}"
+        for j, s in enumerate(suggestions[:5], 1)
+    )
+    return f"{title}: *{searched_name}*\n\nReply with:\n{choices}\n{CONTACT_PROMPT_CHOICES_TAIL}"
+
+
 def build_contact_text_prompt(contact_matches: list, meeting_ids: list, user_id: int) -> str | None:
     """
     Build a text-based prompt for contact linking (works in Beeper/bridges).
@@ -1245,13 +1739,7 @@ def build_contact_text_prompt(contact_matches: list, meeting_ids: list, user_id:
     prompts = []
     pending_links = []  # Queue of unmatched contacts to process
     
-    for i, match in enumerate(contact_matches):
-        meeting_id = match.get('meeting_id') or (meeting_ids[i] if i < len(meeting_ids) else None)
-        if not meeting_id:
-            continue
-            
-        searched_name = match.get('searched_name', 'Unknown')
-        
+    for meeting_id, searched_name, match in _iter_contact_matches(contact_matches, meeting_ids):
         # Skip if already matched with high confidence
         if match.get('matched'):
             linked = match.get('linked_contact', {})
@@ -1274,10 +1762,10 @@ def build_contact_text_prompt(contact_matches: list, meeting_ids: list, user_id:
     
     # Store the queue if we have unmatched contacts
     if pending_links:
-        pending_contact_creation[user_id] = {
+        _set_pending_contact_creation(user_id, {
             'pending_links': pending_links,
             'current_index': 0
-        }
+        })
         
         # Build prompt for the FIRST unmatched contact
         first_contact = pending_links[0]
@@ -1285,30 +1773,8 @@ def build_contact_text_prompt(contact_matches: list, meeting_ids: list, user_id:
         suggestions = first_contact['suggestions']
         
         total_pending = len(pending_links)
-        progress_note = f"(1/{total_pending})" if total_pending > 1 else ""
-        
-        if suggestions:
-            prompt_lines = [f"❓ Unknown contact {progress_note}: *{searched_name}*", ""]
-            prompt_lines.append("Reply with:")
-            for j, suggestion in enumerate(suggestions[:5], 1):
-                name = suggestion.get('name', 'Unknown')
-                company = suggestion.get('company', '')
-                if company:
-                    prompt_lines.append(f"  {j} = {name} ({company})")
-                else:
-                    prompt_lines.append(f"  {j} = {name}")
-            prompt_lines.append(f"  0 = Skip")
-            prompt_lines.append(f"  Or type the correct full name")
-            prompts.append("\n".join(prompt_lines))
-        else:
-            prompt_lines = [
-                f"❓ Unknown contact {progress_note}: *{searched_name}*",
-                "",
-                "Reply with:",
-                "  The correct full name (e.g. 'John Smith')",
-                "  Or '0' to skip"
-            ]
-            prompts.append("\n".join(prompt_lines))
+        title = f"❓ Unknown contact (1/{total_pending})" if total_pending > 1 else "❓ Unknown contact"
+        prompts.append(_format_contact_prompt(title, searched_name, suggestions))
     
     return "\n\n".join(prompts) if prompts else None
 
@@ -1356,28 +1822,7 @@ def _advance_to_next_contact(user_id: int) -> str | None:
     suggestions = contact['suggestions']
     
     total = len(pending_links)
-    progress = f"({current_index + 1}/{total})"
-    
-    if suggestions:
-        prompt_lines = [f"❓ Next contact {progress}: *{searched_name}*", ""]
-        prompt_lines.append("Reply with:")
-        for j, suggestion in enumerate(suggestions[:5], 1):
-            name = suggestion.get('name', 'Unknown')
-            company = suggestion.get('company', '')
-            if company:
-                prompt_lines.append(f"  {j} = {name} ({company})")
-            else:
-                prompt_lines.append(f"  {j} = {name}")
-        prompt_lines.append(f"  0 = Skip")
-        prompt_lines.append(f"  Or type the correct full name")
-        return "\n".join(prompt_lines)
-    else:
-        return (
-            f"❓ Next contact {progress}: *{searched_name}*\n\n"
-            "Reply with:\n"
-            "  The correct full name (e.g. 'John Smith')\n"
-            "  Or '0' to skip"
-        )
+    return _format_contact_prompt(f"❓ Next contact ({current_index + 1}/{total})", searched_name, suggestions)
 
 
 def _clear_pending_contacts(user_id: int) -> bool:
@@ -1398,23 +1843,17 @@ def build_contact_keyboard(contact_matches: list, meeting_ids: list) -> InlineKe
     
     keyboard = []
     
-    for i, match in enumerate(contact_matches):
-        meeting_id = match.get('meeting_id') or (meeting_ids[i] if i < len(meeting_ids) else None)
-        if not meeting_id:
-            continue
-            
-        searched_name = match.get('searched_name', 'Unknown')
-        
+    for meeting_id, searched_name, match in _iter_contact_matches(contact_matches, meeting_ids):
         # If already matched, add a "Correct" button in case it's wrong
         if match.get('matched'):
             linked = match.get('linked_contact', {})
             linked_name = linked.get('name', searched_name)
             correct_key = _short_key("R")  # R = Re-link/correct
-            pending_contact_actions[correct_key] = {
+            _store_contact_action(correct_key, {
                 'meeting_id': meeting_id,
                 'searched_name': searched_name,
                 'current_contact': linked_name
-            }
+            })
             keyboard.append([
                 InlineKeyboardButton(f"✏️ Wrong? Correct '{linked_name}'", callback_data=correct_key)
             ])
@@ -1430,23 +1869,23 @@ def build_contact_keyboard(contact_matches: list, meeting_ids: list) -> InlineKe
                 name = suggestion.get('name', 'Unknown')
                 # Use short key to avoid 64-byte Telegram limit
                 callback_key = _short_key("L")
-                pending_contact_actions[callback_key] = {
+                _store_contact_action(callback_key, {
                     'meeting_id': meeting_id,
                     'contact_id': contact_id,
                     'contact_name': name,
                     'searched_name': searched_name
-                }
+                })
                 row.append(InlineKeyboardButton(name, callback_data=callback_key))
             keyboard.append(row)
             
             # Add "Create New" and "Skip" buttons
             create_key = _short_key("C")
             skip_key = _short_key("S")
-            pending_contact_actions[create_key] = {
+            _store_contact_action(create_key, {
                 'meeting_id': meeting_id,
                 'searched_name': searched_name
-            }
-            pending_contact_actions[skip_key] = {'meeting_id': meeting_id}
+            })
+            _store_contact_action(skip_key, {'meeting_id': meeting_id})
             
             # Truncate display name if too long
             display_name = searched_name[:15] + "..." if len(searched_name) > 15 else searched_name
@@ -1458,11 +1897,11 @@ def build_contact_keyboard(contact_matches: list, meeting_ids: list) -> InlineKe
             # No suggestions - just Create or Skip
             create_key = _short_key("C")
             skip_key = _short_key("S")
-            pending_contact_actions[create_key] = {
+            _store_contact_action(create_key, {
                 'meeting_id': meeting_id,
                 'searched_name': searched_name
-            }
-            pending_contact_actions[skip_key] = {'meeting_id': meeting_id}
+            })
+            _store_contact_action(skip_key, {'meeting_id': meeting_id})
             
             display_name = searched_name[:15] + "..." if len(searched_name) > 15 else searched_name
             keyboard.append([
@@ -1481,23 +1920,19 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     callback_data = query.data
     logger.info(f"Callback received: {callback_data}")
     
-    # Check if action exists in pending (short keys: L=link, C=create, S=skip)
-    action_data = pending_contact_actions.get(callback_data)
-    
-    if callback_data.startswith("L:"):
-        # Link to existing contact
-        await handle_link_contact(query, callback_data, action_data)
-    elif callback_data.startswith("C:"):
-        # Create new contact
-        await handle_create_contact(query, callback_data, action_data)
-    elif callback_data.startswith("S:"):
-        # Skip linking
-        await query.edit_message_reply_markup(reply_markup=None)
-        await query.message.reply_text("⏭️ Skipped contact linking.")
-        pending_contact_actions.pop(callback_data, None)
-    elif callback_data.startswith("R:"):
-        # Re-link/correct a wrong match
-        await handle_correct_contact(query, callback_data, action_data)
+    # Key prefix picks the handler (see CALLBACK_HANDLERS)
+    handler = CALLBACK_HANDLERS.get(callback_data.partition(":")[0])
+    if handler:
+        await handler(query, callback_data, _get_contact_action(callback_data))
+
+
+async def handle_skip_contact(query, callback_data: str, action_data: dict) -> None:
+    """Skip linking - drops the meeting's other buttons too."""
+    await query.edit_message_reply_markup(reply_markup=None)
+    await query.message.reply_text("⏭️ Skipped contact linking.")
+    pending_contact_actions.pop(callback_data, None)
+    if action_data:
+        _drop_meeting_actions(action_data['meeting_id'])
 
 
 async def handle_link_contact(query, callback_data: str, action_data: dict) -> None:
@@ -1517,26 +1952,25 @@ async def handle_link_contact(query, callback_data: str, action_data: dict) -> N
             return
             
         auth_headers = get_auth_headers(INTELLIGENCE_SERVICE_URL)
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.patch(
-                f"{INTELLIGENCE_SERVICE_URL}/api/v1/meetings/{meeting_id}/link-contact",
-                json={"contact_id": contact_id},
-                headers=auth_headers
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                company = result.get('company', '')
-                if company:
-                    await query.edit_message_reply_markup(reply_markup=None)
-                    await query.message.reply_text(f"✅ Linked to: {contact_name} ({company})")
-                else:
-                    await query.edit_message_reply_markup(reply_markup=None)
-                    await query.message.reply_text(f"✅ Linked to: {contact_name}")
-                logger.info(f"Linked meeting {meeting_id} to contact {contact_id}")
+        response = await http_client.patch(
+            f"{INTELLIGENCE_SERVICE_URL}/api/v1/meetings/{meeting_id}/link-contact",
+            json={"contact_id": contact_id},
+            headers=auth_headers
+        )
+        
+        if response.status_code == 200:
+            result = orjson.loads(response.content)
+            company = result.get('company', '')
+            if company:
+                await query.edit_message_reply_markup(reply_markup=None)
+                await query.message.reply_text(f"✅ Linked to: {contact_name} ({company})")
             else:
-                await query.message.reply_text(f"❌ Failed to link contact: {response.text}")
-                
+                await query.edit_message_reply_markup(reply_markup=None)
+                await query.message.reply_text(f"✅ Linked to: {contact_name}")
+            logger.info(f"Linked meeting {meeting_id} to contact {contact_id}")
+        else:
+            await query.message.reply_text(f"❌ Failed to link contact: {response.text}")
+            
     except Exception as e:
         logger.error(f"Error linking contact: {e}")
         await query.message.reply_text(f"❌ Error: {str(e)}")
@@ -1559,12 +1993,12 @@ async def handle_correct_contact(query, callback_data: str, action_data: dict) -
     
     # Store pending creation state for this user (expires in 5 minutes)
     # mode='correct' tells the handler this is a correction, not a new contact
-    pending_contact_creation[user_id] = {
+    _set_pending_contact_creation(user_id, {
         'meeting_id': meeting_id,
         'suggested_name': searched_name,
         'mode': 'correct',
-        'expires': time.time() + 300
-    }
+        'expires': time.monotonic() + 300
+    })
     
     # Remove keyboard and ask for the correct name
     await query.edit_message_reply_markup(reply_markup=None)
@@ -1592,11 +2026,11 @@ async def handle_create_contact(query, callback_data: str, action_data: dict) ->
     user_id = query.from_user.id
     
     # Store pending creation state for this user (expires in 5 minutes)
-    pending_contact_creation[user_id] = {
+    _set_pending_contact_creation(user_id, {
         'meeting_id': meeting_id,
         'suggested_name': searched_name,
-        'expires': time.time() + 300  # 5 minute timeout
-    }
+        'expires': time.monotonic() + 300  # 5 minute timeout
+    })
     
     # Remove keyboard and ask for the name
     await query.edit_message_reply_markup(reply_markup=None)
@@ -1611,6 +2045,15 @@ async def handle_create_contact(query, callback_data: str, action_data: dict) ->
     pending_contact_actions.pop(callback_data, None)
 
 
+# Callback key prefix -> handler (keys come from _short_key)
+CALLBACK_HANDLERS = {
+    "L": handle_link_contact,     # Link to existing contact
+    "C": handle_create_contact,   # Create new contact
+    "S": handle_skip_contact,     # Skip linking
+    "R": handle_correct_contact,  # Re-link/correct a wrong match
+}
+
+
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle text messages - used for typing contact names, selections, or AI chat."""
     user = update.effective_user
@@ -1637,66 +2080,67 @@ async def _handle_ai_chat(update: Update, user_id: int) -> None:
     message_text = update.message.text.strip()
     
     if not INTELLIGENCE_SERVICE_URL:
-        await update.message.reply_text(
-            "👋 Send me a voice message or audio file to process!\n\n"
-            "Type /help for more info."
-        )
+        if _should_send_help(user_id):
+            await update.message.reply_text(
+                "👋 Send me a voice message or audio file to process!\n\n"
+                "Type /help for more info."
+            )
         return
     
     # Send typing indicator
     await update.message.chat.send_action("typing")
     
     # Get conversation history for context
-    history = _get_conversation_history(user_id)
+    history = await _get_conversation_history(user_id)
     
     try:
         auth_headers = get_auth_headers(INTELLIGENCE_SERVICE_URL)
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                f"{INTELLIGENCE_SERVICE_URL}/api/v1/chat",
-                json={
-                    "message": message_text,
-                    "conversation_history": history
-                },
-                headers=auth_headers
-            )
+        response = await http_client.post(
+            f"{INTELLIGENCE_SERVICE_URL}/api/v1/chat",
+            json={
+                "message": message_text,
+                "conversation_history": history
+            },
+            headers=auth_headers,
+            timeout=CHAT_TIMEOUT
+        )
+        
+        if response.status_code == 200:
+            result = orjson.loads(response.content)
+            ai_response = result.get("response", "Sorry, I couldn't process that.")
+            tools_used = result.get("tools_used", [])
             
-            if response.status_code == 200:
-                result = response.json()
-                ai_response = result.get("response", "Sorry, I couldn't process that.")
-                tools_used = result.get("tools_used", [])
-                
-                # Save both user message and assistant response to Supabase (permanent)
-                _add_to_conversation_history(user_id, "user", message_text)
-                _add_to_conversation_history(user_id, "assistant", ai_response, tools_used)
-                
-                # Add subtle indicator if tools were used
-                if tools_used:
-                    ai_response += f"\n\n_📊 Queried: {', '.join(tools_used)}_"
-                
-                # Send response (handle Telegram's 4096 char limit)
-                async def send_with_fallback(text: str):
-                    """Try Markdown first, fall back to plain text if parsing fails."""
-                    try:
-                        await update.message.reply_text(text, parse_mode='Markdown')
-                    except Exception as markdown_error:
-                        logger.warning(f"Markdown parsing failed, sending plain: {markdown_error}")
-                        # Strip markdown formatting and send plain
-                        plain_text = text.replace('**', '').replace('__', '').replace('_', '').replace('`', '')
-                        await update.message.reply_text(plain_text)
-                
-                if len(ai_response) > 4000:
-                    # Split into chunks
-                    for i in range(0, len(ai_response), 4000):
-                        await send_with_fallback(ai_response[i:i+4000])
-                else:
-                    await send_with_fallback(ai_response)
+            # Save both user message and assistant response to Supabase (permanent)
+            await _add_to_conversation_history(user_id, "user", message_text)
+            await _add_to_conversation_history(user_id, "assistant", ai_response, tools_used)
+            
+            # Add subtle indicator if tools were used
+            if tools_used:
+                ai_response += f"\n\n_📊 Queried: {', '.join(tools_used)}_"
+            
+            # Send response (handle Telegram's 4096 char limit)
+            async def send_with_fallback(text: str):
+                """Try Markdown first, fall back to plain text if parsing fails."""
+                try:
+                    await update.message.reply_text(text, parse_mode='Markdown')
+                except Exception as markdown_error:
+                    logger.warning(f"Markdown parsing failed, sending plain: {markdown_error}")
+                    # Strip markdown formatting and send plain
+                    plain_text = text.replace('**', '').replace('__', '').replace('_', '').replace('`', '')
+                    await update.message.reply_text(plain_text)
+            
+            if len(ai_response) > 4000:
+                # Split into chunks
+                for i in range(0, len(ai_response), 4000):
+                    await send_with_fallback(ai_response[i:i+4000])
             else:
-                logger.error(f"Chat API error: {response.status_code} - {response.text}")
-                await update.message.reply_text(
-                    "❌ Sorry, I couldn't process that. Try again later."
-                )
-                
+                await send_with_fallback(ai_response)
+        else:
+            logger.error(f"Chat API error: {response.status_code} - {response.text}")
+            await update.message.reply_text(
+                "❌ Sorry, I couldn't process that. Try again later."
+            )
+            
     except httpx.TimeoutException:
         await update.message.reply_text(
             "⏱️ That query is taking too long. Try a simpler question."
@@ -1745,28 +2189,27 @@ async def _handle_contact_linking(update: Update, user_id: int, current_contact:
             try:
                 logger.info(f"Linking meeting {meeting_id} to contact {contact_id} ({contact_name})")
                 auth_headers = get_auth_headers(INTELLIGENCE_SERVICE_URL)
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.patch(
-                        f"{INTELLIGENCE_SERVICE_URL}/api/v1/meetings/{meeting_id}/link-contact",
-                        json={"contact_id": contact_id},
-                        headers=auth_headers
-                    )
+                response = await http_client.patch(
+                    f"{INTELLIGENCE_SERVICE_URL}/api/v1/meetings/{meeting_id}/link-contact",
+                    json={"contact_id": contact_id},
+                    headers=auth_headers
+                )
+                
+                if response.status_code == 200:
+                    result = orjson.loads(response.content)
+                    company = result.get('company', '')
+                    link_msg = f"✅ Linked to: {contact_name}" + (f" ({company})" if company else "")
+                    logger.info(f"Successfully linked meeting {meeting_id} to contact {contact_id}")
                     
-                    if response.status_code == 200:
-                        result = response.json()
-                        company = result.get('company', '')
-                        link_msg = f"✅ Linked to: {contact_name}" + (f" ({company})" if company else "")
-                        logger.info(f"Successfully linked meeting {meeting_id} to contact {contact_id}")
-                        
-                        # Move to next contact
-                        next_prompt = _advance_to_next_contact(user_id)
-                        if next_prompt:
-                            await update.message.reply_text(f"{link_msg}\n\n{next_prompt}")
-                        else:
-                            await update.message.reply_text(f"{link_msg}\n\n✅ All contacts processed!")
+                    # Move to next contact
+                    next_prompt = _advance_to_next_contact(user_id)
+                    if next_prompt:
+                        await update.message.reply_text(f"{link_msg}\n\n{next_prompt}")
                     else:
-                        logger.error(f"Failed to link contact - status={response.status_code}, response={response.text}")
-                        await update.message.reply_text(f"❌ Failed to link: {response.text}")
+                        await update.message.reply_text(f"{link_msg}\n\n✅ All contacts processed!")
+                else:
+                    logger.error(f"Failed to link contact - status={response.status_code}, response={response.text}")
+                    await update.message.reply_text(f"❌ Failed to link: {response.text}")
             except Exception as e:
                 logger.error(f"Error linking contact: {e}", exc_info=True)
                 await update.message.reply_text(f"❌ Error: {str(e)}")
@@ -1793,79 +2236,81 @@ async def _handle_contact_linking(update: Update, user_id: int, current_contact:
             return
             
         auth_headers = get_auth_headers(INTELLIGENCE_SERVICE_URL)
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # First, search for existing contact with this name
-            search_response = await client.get(
-                f"{INTELLIGENCE_SERVICE_URL}/api/v1/contacts/search",
-                params={"q": typed_name, "limit": 5},
-                headers=auth_headers
-            )
-            
-            existing_contacts = []
-            if search_response.status_code == 200:
-                existing_contacts = search_response.json().get('contacts', [])
-            
-            # If we found matches, update current contact's suggestions and ask user to select
-            if existing_contacts:
-                # Update the current contact in the queue with new suggestions
-                if user_id in pending_contact_creation:
-                    data = pending_contact_creation[user_id]
-                    idx = data.get('current_index', 0)
-                    if idx < len(data.get('pending_links', [])):
-                        data['pending_links'][idx]['suggestions'] = existing_contacts
-                        data['pending_links'][idx]['searched_name'] = typed_name
-                
-                prompt_lines = [f"Found existing contacts matching '{typed_name}':", ""]
-                for j, contact in enumerate(existing_contacts[:5], 1):
-                    name = contact.get('name', 'Unknown')
-                    company = contact.get('company', '')
-                    if company:
-                        prompt_lines.append(f"  {j} = {name} ({company})")
-                    else:
-                        prompt_lines.append(f"  {j} = {name}")
-                prompt_lines.append(f"  0 = Create new '{typed_name}'")
-                
-                await update.message.reply_text("\n".join(prompt_lines))
-                return
+        # First, search for existing contact with this name
+        existing_contacts = await _search_contacts(typed_name, auth_headers)
+        
+        # If we found matches, update current contact's suggestions and ask user to select
+        if existing_contacts:
+            # Update the current contact in the queue with new suggestions
+            if user_id in pending_contact_creation:
+                data = pending_contact_creation[user_id]
+                idx = data.get('current_index', 0)
+                if idx < len(data.get('pending_links', [])):
+                    data['pending_links'][idx]['suggestions'] = existing_contacts
+                    data['pending_links'][idx]['searched_name'] = typed_name
             
-            # No existing contacts found - create new one
-            payload = {
-                "first_name": first_name,
-                "link_to_meeting_id": meeting_id
-            }
-            if last_name:
-                payload["last_name"] = last_name
+            prompt_lines = [f"Found existing contacts matching '{typed_name}':", ""]
+            for j, contact in enumerate(existing_contacts[:5], 1):
+                name = contact.get('name', 'Unknown')
+                company = contact.get('company', '')
+                if company:
+                    prompt_lines.append(f"  {j} = {name} ({company})")
+                else:
+                    prompt_lines.append(f"  {j} = {name}")
+            prompt_lines.append(f"  0 = Create new '{typed_name}'")
             
-            response = await client.post(
-                f"{INTELLIGENCE_SERVICE_URL}/api/v1/contacts",
-                json=payload,
-                headers=auth_headers
-            )
+            await update.message.reply_text("\n".join(prompt_lines))
+            return
+        
+        # No existing contacts found - create new one
+        payload = {
+            "first_name": first_name,
+            "link_to_meeting_id": meeting_id
+        }
+        if last_name:
+            payload["last_name"] = last_name
+        
+        response = await http_client.post(
+            f"{INTELLIGENCE_SERVICE_URL}/api/v1/contacts",
+            json=payload,
+            headers=auth_headers
+        )
+        
+        if response.status_code == 200:
+            result = orjson.loads(response.content)
+            contact_name = result.get('contact_name', typed_name)
+            create_msg = f"✅ Created and linked: {contact_name}"
+            _contact_search_cache.clear()  # Cached hits may now be missing the new contact
+            logger.info(f"Created contact '{contact_name}' and linked to meeting {meeting_id}")
             
-            if response.status_code == 200:
-                result = response.json()
-                contact_name = result.get('contact_name', typed_name)
-                create_msg = f"✅ Created and linked: {contact_name}"
-                logger.info(f"Created contact '{contact_name}' and linked to meeting {meeting_id}")
-                
-                # Move to next contact
-                next_prompt = _advance_to_next_contact(user_id)
-                if next_prompt:
-                    await update.message.reply_text(f"{create_msg}\n\n{next_prompt}")
-                else:
-                    await update.message.reply_text(f"{create_msg}\n\n✅ All contacts processed!")
+            # Move to next contact
+            next_prompt = _advance_to_next_contact(user_id)
+            if next_prompt:
+                await update.message.reply_text(f"{create_msg}\n\n{next_prompt}")
             else:
-                await update.message.reply_text(f"❌ Failed to create contact: {response.text}")
-                
+                await update.message.reply_text(f"{create_msg}\n\n✅ All contacts processed!")
+        else:
+            await update.message.reply_text(f"❌ Failed to create contact: {response.text}")
+            
     except Exception as e:
         logger.error(f"Error handling contact: {e}")
         await update.message.reply_text(f"❌ Error: {str(e)}")
 
 
+def build_telegram_request() -> HTTPXRequest:
+    """Pooled HTTP/2 client for Bot API calls and file downloads (getFile + download share a connection)."""
+    return HTTPXRequest(
+        connection_pool_size=256,  # PTB 20.x defaults to a single connection
+        read_timeout=30,
+        write_timeout=30,
+        http_version="2"
+    )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize bot application on startup."""
-    global bot_app
+    global bot_app, http_client
     
     if not TELEGRAM_TOKEN:
         raise ValueError("TELEGRAM_BOT_TOKEN not set")
@@ -1873,8 +2318,18 @@ async def lifespan(app: FastAPI):
     if not GOOGLE_DRIVE_FOLDER_ID:
         raise ValueError("GOOGLE_DRIVE_FOLDER_ID not set")
     
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BLOCKING_IO_THREADS, thread_name_prefix="blocking-io")
+    )
+    
+    http_client = httpx.AsyncClient(
+        timeout=SERVICE_TIMEOUT,
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    )
+    
     # Create bot application
-    bot_app = Application.builder().token(TELEGRAM_TOKEN).build()
+    bot_app = Application.builder().token(TELEGRAM_TOKEN).request(build_telegram_request()).build()
     
     # Add handlers
     bot_app.add_handler(CommandHandler("start", start))
@@ -1883,43 +2338,80 @@ async def lifespan(app: FastAPI):
     bot_app.add_handler(CommandHandler("process", process_audios_command))
     bot_app.add_handler(CommandHandler("audios", process_audios_command))  # Alias
     bot_app.add_handler(CommandHandler("sync", sync_command))
-    bot_app.add_handler(MessageHandler(filters.VOICE, handle_voice))
-    bot_app.add_handler(MessageHandler(filters.AUDIO, handle_audio))
+    bot_app.add_handler(MessageHandler(filters.VOICE | filters.AUDIO, handle_media))
     bot_app.add_handler(MessageHandler(filters.LOCATION, handle_location))
     bot_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     bot_app.add_handler(CallbackQueryHandler(handle_callback_query))
     
+    # Warm the Drive client (credentials + TLS connection) so the first upload doesn't pay for it
+    try:
+        await asyncio.to_thread(warm_drive_connection)
+    except Exception as e:
+        logger.warning(f"Could not initialize Google Drive service: {e}")
+    
     # Initialize bot
     await bot_app.initialize()
     await bot_app.start()
     
-    # Set webhook
+    # Set webhook (skipped if already registered - every worker runs this on startup).
+    # The registered secret can't be read back, so re-register whenever one is configured.
     if WEBHOOK_URL:
         webhook_url = f"{WEBHOOK_URL}/webhook"
-        await bot_app.bot.set_webhook(webhook_url)
-        logger.info(f"Webhook set to: {webhook_url}")
+        webhook_info = await bot_app.bot.get_webhook_info()
+        needs_update = (
+            webhook_info.url != webhook_url
+            or webhook_info.max_connections != WEBHOOK_MAX_CONNECTIONS
+            or set(webhook_info.allowed_updates or ()) != set(WEBHOOK_ALLOWED_UPDATES)
+            or WEBHOOK_SECRET
+        )
+        if needs_update:
+            await bot_app.bot.set_webhook(
+                webhook_url,
+                secret_token=WEBHOOK_SECRET or None,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=WEBHOOK_ALLOWED_UPDATES
+            )
+            logger.info(f"Webhook set to: {webhook_url}")
+        else:
+            logger.info(f"Webhook already set to: {webhook_url}")
     
     logger.info("Jarvis Telegram bot started (webhook mode)")
     
     yield
     
-    # Cleanup
+    # Cleanup - let in-flight updates and audio jobs finish before the bot goes away,
+    # but only as long as the platform's grace period allows
+    pending = _update_tasks | _audio_tasks
+    if pending:
+        logger.info(f"Waiting up to {SHUTDOWN_DRAIN_TIMEOUT:.0f}s for {len(pending)} in-flight task(s) to finish")
+        _, pending = await asyncio.wait(pending, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        if pending:
+            logger.warning(f"Cancelling {len(pending)} task(s) still running at shutdown")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
     await bot_app.stop()
     await bot_app.shutdown()
+    await http_client.aclose()
+
 
+# FastAPI app for webhook (orjson for the JSON responses too)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
-# FastAPI app for webhook
-app = FastAPI(lifespan=lifespan)
+
+# Probe responses never change - encode them once
+ROOT_RESPONSE = orjson.dumps({"status": "Jarvis Telegram Bot is running", "mode": "webhook"})
+HEALTH_RESPONSE = orjson.dumps({"status": "healthy"})
 
 
 @app.get("/")
 async def root():
-    return {"status": "Jarvis Telegram Bot is running", "mode": "webhook"}
+    return Response(content=ROOT_RESPONSE, media_type="application/json")
 
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy"}
+    return Response(content=HEALTH_RESPONSE, media_type="application/json")
 
 
 @app.post("/webhook")
@@ -1927,15 +2419,58 @@ async def webhook(request: Request):
     """Handle incoming Telegram updates via webhook."""
     global bot_app
     
+    # Reject non-Telegram traffic before reading or parsing the body
+    if WEBHOOK_SECRET:
+        # Compare bytes - str compare_digest raises on non-ASCII (headers arrive as latin-1)
+        token = request.headers.get("x-telegram-bot-api-secret-token", "").encode('latin-1')
+        if not hmac.compare_digest(token, WEBHOOK_SECRET.encode()):
+            logger.warning("Webhook request with invalid secret token rejected")
+            return Response(status_code=401)
+    
     try:
-        data = await request.json()
-        update = Update.de_json(data, bot_app.bot)
-        await bot_app.process_update(update)
-        return Response(status_code=200)
+        data = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        logger.warning("Webhook request with malformed JSON body rejected")
+        return Response(status_code=400)
+    
+    if not isinstance(data, dict) or 'update_id' not in data:
+        logger.warning("Webhook request without a Telegram update rejected")
+        return Response(status_code=400)
+    
+    # Drop unauthorized senders early: button presses always (their handlers don't
+    # check), messages unless the "not authorized" reply is due again
+    kind = 'callback_query' if 'callback_query' in data else 'message' if 'message' in data else None
+    if kind:
+        payload = data[kind]
+        sender = payload.get('from', {}) if isinstance(payload, dict) else None
+        sender_id = sender.get('id') if isinstance(sender, dict) else None
+        if not isinstance(sender, dict) or (sender_id is not None and not isinstance(sender_id, int)):
+            logger.warning(f"Webhook update with malformed {kind} rejected")
+            return Response(status_code=400)
+        if sender_id is not None and not is_authorized(sender_id):
+            if kind == 'callback_query' or not _should_reply_unauthorized(sender_id):
+                return Response(status_code=200)
     
+    try:
+        update = Update.de_json(data, bot_app.bot)
     except Exception as e:
         logger.error(f"Webhook error: {e}", exc_info=True)
         return Response(status_code=500)
+    
+    # Ack immediately - Telegram re-delivers updates when the webhook call is slow
+    task = asyncio.create_task(_process_update_in_background(update))
+    _update_tasks.add(task)
+    task.add_done_callback(_update_tasks.discard)
+    return Response(status_code=200)
+
+
+async def _process_update_in_background(update: Update) -> None:
+    """Run the bot handlers for one update, bounded by MAX_CONCURRENT_UPDATES."""
+    async with _update_semaphore:
+        try:
+            await bot_app.process_update(update)
+        except Exception as e:
+            logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
 
 
 class MessageRequest(BaseModel):
@@ -1979,4 +2514,14 @@ async def send_message_endpoint(msg: MessageRequest):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8080))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Contact-linking and dedup state live in process memory, so keep a single
+    # worker unless that state is shared; raise WEB_CONCURRENCY to scale out
+    uvicorn.run(
+        "main_webhook:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        access_log=False,  # Cloud Run already logs every request
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )